@@ -0,0 +1,75 @@
+# Balance analysis of an account's transaction history with numpy.
+#
+# The running balance is a cumulative sum over the ledger columns, and zone breaches (the
+# balance staying below a threshold) are found with vectorized comparisons: the points where
+# the below-threshold mask switches on and off are the starts and ends of the breaches.
+import numpy as np
+
+from FlazzExport import iter_history_chunks
+
+
+# Method to get the running balance of an account as (timestamps, balances) numpy arrays: the
+# balance in minor units right after every transaction, in time order (imports can record older
+# transactions after newer ones). start and end select a time window (see
+# FlazzExport.iter_history_chunks), whose balances continue from the balance before it.
+def running_balance(account, start=None, end=None):
+    chunks = list(iter_history_chunks(account, start=start, end=end, time_order=True))
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    timestamps = np.concatenate([chunk[2] for chunk in chunks])
+    balances = np.concatenate([chunk[3] for chunk in chunks])
+    return timestamps, balances
+
+
+# Define a class for the breaches of one zone: the stretches of the history during which the
+# balance stayed below the threshold. Breach i starts at transaction starts[i] and ends at
+# transaction ends[i], the first one that brought the balance back up. A breach still going on
+# at the last transaction ends there and is marked ongoing.
+class ZoneBreaches:
+    def __init__(self, threshold, timestamps, balances):
+        self.threshold = threshold
+        count = len(balances)
+
+        below = np.concatenate(([False], balances < threshold, [False]))
+        changes = np.diff(below.view(np.int8))
+        self.starts = np.flatnonzero(changes == 1)
+        self.ends = np.flatnonzero(changes == -1)
+
+        self.ongoing = self.ends == count
+        self.ends = np.minimum(self.ends, count - 1)
+        self.start_times = timestamps[self.starts]
+        self.end_times = timestamps[self.ends]
+        self.durations = self.end_times - self.start_times  # Seconds
+        # Balances between breaches are at or above the threshold, so the minimum from one breach
+        # start to the next is the lowest balance of the breach
+        self.lowest = np.minimum.reduceat(balances, self.starts) if len(self.starts) else np.empty(0, dtype=balances.dtype)
+
+    @property
+    def count(self):
+        return len(self.starts)
+
+    @property
+    def total_duration(self):
+        return int(self.durations.sum())
+
+    @property
+    def longest_duration(self):
+        return int(self.durations.max()) if self.count else 0
+
+    # Method to get the breaches as (start index, end index) pairs
+    def intervals(self):
+        return list(zip(self.starts.tolist(), self.ends.tolist()))
+
+
+# Method to find the breaches of a set of zones in one running balance. Returns {name: ZoneBreaches}.
+def find_breaches(timestamps, balances, zones):
+    return {name: ZoneBreaches(threshold, timestamps, balances) for name, threshold in zones.items()}
+
+
+# Helper function to format a duration in seconds like "3d 4h 5m"
+def format_duration(seconds):
+    days, seconds = divmod(int(seconds), 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    parts = [f"{value}{unit}" for value, unit in ((days, "d"), (hours, "h"), (minutes, "m")) if value]
+    return " ".join(parts) if parts else f"{seconds}s"
@@ -0,0 +1,186 @@
+# Bank-wide analytics: totals by category, top spenders and the balance distribution across all
+# accounts.
+#
+# The accounts are split into partitions of about equal transaction counts, every partition is
+# summarized on a process pool (see FlazzWorkers), and the partial results are merged. Totals and
+# balances are summed exactly as int64 minor units and only formatted as rupiah in the report text.
+#
+# Usage: python FlazzBankAnalytics.py [--data-dir DIR] [--start TIME] [--end TIME] [--workers N] [--top N]
+#        python FlazzBankAnalytics.py --benchmark ACCOUNTS [--workers N]
+import argparse
+import heapq
+import os
+import time
+from array import array
+
+import numpy as np
+
+from FlazzCore import Bank, Transaction, SPENDING_CATEGORIES, DATA_DIR, timestamp_seconds, format_timestamp
+from FlazzWorkers import account_pool, describe_account, entry_columns, fork_available
+
+PARTITIONS_PER_WORKER = 4  # More partitions than workers keep the pool busy when partitions differ in cost
+
+
+# Define a class for the merged report
+class BankReport:
+    def __init__(self, category_totals, category_counts, top_spenders, balances, bins, start, end):
+        self.start = start  # Time window of the report (seconds), None for open ends
+        self.end = end
+        self.category_totals = category_totals  # Category: total amount (minor units, like all amounts here)
+        self.category_counts = category_counts  # Category: number of transactions
+        self.top_spenders = top_spenders  # (spending, account number, account holder), highest first
+
+        # Balance distribution (balances at the end of the window). The mean and percentiles are
+        # rounded to whole minor units.
+        self.account_count = len(balances)
+        self.total_balance = int(balances.sum())
+        self.mean_balance = round(self.total_balance / len(balances)) if len(balances) else 0
+        self.balance_percentiles = dict(zip((10, 25, 50, 75, 90, 99), np.rint(np.percentile(balances, (10, 25, 50, 75, 90, 99))).astype(np.int64).tolist())) if len(balances) else {}
+        self.balance_histogram = np.histogram(balances, bins=bins) if len(balances) else (np.zeros(0, dtype=np.int64), np.zeros(0))
+
+    def __str__(self):
+        lines = [f"Accounts: {self.account_count:,}"]
+        if self.start is not None or self.end is not None:
+            lines.append(f"Window: {format_timestamp(self.start) if self.start is not None else 'start'} to "
+                         f"{format_timestamp(self.end) if self.end is not None else 'now'}")
+        lines.append("Totals by category:")
+        format_currency = Transaction.format_currency
+        for category, total in sorted(self.category_totals.items(), key=lambda item: item[1]):
+            lines.append(f"  {category:<22} {format_currency(total):>20} IDR  ({self.category_counts[category]:,} transactions)")
+        lines.append("Top spenders:")
+        for spending, number, holder in self.top_spenders:
+            lines.append(f"  {number}  {holder:<30} {format_currency(spending):>20} IDR")
+        lines.append(f"Balances: total {format_currency(self.total_balance)} IDR, mean {format_currency(self.mean_balance)} IDR")
+        for percentile, value in self.balance_percentiles.items():
+            lines.append(f"  p{percentile:<3} {format_currency(value):>20} IDR")
+        return "\n".join(lines)
+
+
+# Method to summarize one partition of account entries (see FlazzWorkers.describe_account).
+# Returns (category totals, category counts, top spenders, balances) for merging.
+def summarize_partition(partition, start, end, top):
+    category_totals = {}
+    category_counts = {}
+    spenders = []
+    balances = np.empty(len(partition), dtype=np.int64)
+
+    for position, entry in enumerate(partition):
+        number, holder, opening_balance = entry[:3]
+        amounts, timestamps, codes, categories = entry_columns(entry)
+
+        # The balance at the end of the window counts everything before it
+        if end is not None:
+            before_end = timestamps < end
+            balances[position] = opening_balance + amounts[before_end].sum()
+        else:
+            before_end = None
+            balances[position] = opening_balance + amounts.sum()
+
+        if start is not None or end is not None:
+            selected = before_end if before_end is not None else np.ones(len(amounts), dtype=bool)
+            if start is not None:
+                selected &= timestamps >= start
+            amounts = amounts[selected]
+            codes = codes[selected]
+
+        # Integer sums per category (bincount would sum in floating point)
+        totals = np.zeros(len(categories), dtype=np.int64)
+        np.add.at(totals, codes, amounts)
+        counts = np.bincount(codes, minlength=len(categories))
+        spending = 0
+        for code, category in enumerate(categories):
+            if counts[code]:
+                total = int(totals[code])
+                category_totals[category] = category_totals.get(category, 0) + total
+                category_counts[category] = category_counts.get(category, 0) + int(counts[code])
+                if category in SPENDING_CATEGORIES:
+                    spending -= total
+        if spending > 0:
+            spenders.append((spending, number, holder))
+
+    return category_totals, category_counts, heapq.nlargest(top, spenders), balances
+
+
+# Helper function to split accounts into partitions of about equal transaction counts
+def make_partitions(entries, partition_count):
+    partitions = [[] for _ in range(partition_count)]
+    loads = [(0, index) for index in range(partition_count)]
+    # Largest accounts first, each to the least loaded partition
+    for entry in sorted(entries, key=lambda entry: entry[3], reverse=True):
+        load, index = heapq.heappop(loads)
+        partitions[index].append(entry)
+        heapq.heappush(loads, (load + entry[3] + 1, index))
+    return [partition for partition in partitions if partition]
+
+
+# Method to build the bank-wide report. start and end limit the category totals and spending to
+# transactions with start <= timestamp < end (seconds or display strings); balances are taken at
+# end. workers=1 runs in this process.
+def bank_report(bank, start=None, end=None, top=10, bins=10, workers=None):
+    start = timestamp_seconds(start)
+    end = timestamp_seconds(end)
+    workers = workers or os.cpu_count() or 1
+
+    with bank.accounts_lock:
+        accounts = list(bank.accounts.values())
+    parallel = workers > 1 and len(accounts) > 1
+    can_fork = parallel and fork_available()
+    entries = [describe_account(account, with_columns=not can_fork) for account in accounts]
+
+    if not parallel:
+        parts = [summarize_partition(entries, start, end, top)] if entries else []
+    else:
+        partitions = make_partitions(entries, workers * PARTITIONS_PER_WORKER)
+        with account_pool(bank, min(workers, len(partitions)), can_fork) as pool:
+            parts = list(pool.map(summarize_partition, partitions, [start] * len(partitions),
+                                  [end] * len(partitions), [top] * len(partitions)))
+
+    # Merge the partial results
+    category_totals = {}
+    category_counts = {}
+    for totals, counts, spenders, balances in parts:
+        for category, total in totals.items():
+            category_totals[category] = category_totals.get(category, 0) + total
+            category_counts[category] = category_counts.get(category, 0) + counts[category]
+    top_spenders = heapq.nlargest(top, (spender for part in parts for spender in part[2]))
+    balances = np.concatenate([part[3] for part in parts]) if parts else np.empty(0, dtype=np.int64)
+    return BankReport(category_totals, category_counts, top_spenders, balances, bins, start, end)
+
+
+# Benchmark: report on a synthetic bank with the given number of accounts
+def benchmark(account_count, workers=None, transactions=200):
+    bank = Bank("Benchmark")
+    rng = np.random.default_rng(0)
+    categories = ["Deposit"] + SPENDING_CATEGORIES
+    for index in range(account_count):
+        account = bank.create_account(f"{index:010d}", f"Holder {index}", 0)
+        codes = rng.integers(0, len(categories), transactions).astype(np.uint16)
+        amounts = np.where(codes == 0, 5000000, -rng.integers(100000, 2000000, transactions)).astype(np.int64)
+        timestamps = np.arange(1_700_000_000, 1_700_000_000 + transactions * 3600, 3600, dtype=np.int64)
+        account.record_batch(amounts.tobytes(), timestamps.tobytes(), array("H", codes.tobytes()), categories)
+
+    for count in sorted({1, workers or os.cpu_count() or 1}):
+        started = time.perf_counter()
+        bank_report(bank, workers=count)
+        elapsed = time.perf_counter() - started
+        print(f"{account_count:,} accounts x {transactions} transactions, {count} worker(s): {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bank-wide Flazz card analytics.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help=f"bank data directory (default: {DATA_DIR})")
+    parser.add_argument("--start", help="only count transactions from this time on (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--end", help="only count transactions before this time (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--top", type=int, default=10, help="number of top spenders to list")
+    parser.add_argument("--benchmark", type=int, metavar="ACCOUNTS", help="report on a synthetic bank instead")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.workers)
+    else:
+        bank = Bank("MyFlazzID", data_dir=args.data_dir)
+        try:
+            print(bank_report(bank, args.start, args.end, args.top, workers=args.workers))
+        finally:
+            bank.close()
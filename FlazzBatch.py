@@ -0,0 +1,168 @@
+# Headless batch rendering of statements for every cardholder: the dashboard chart as a JPEG
+# image and the PDF statement, like export_to_pdf and save_chart_as_jpeg in the app.
+#
+# Accounts are handed to a pool of worker processes in small groups (see FlazzWorkers). Every
+# worker renders with the Agg backend and keeps one figure for all its accounts, clearing the axes
+# between them instead of building a new figure each time.
+#
+# Usage: python FlazzBatch.py OUTPUT_DIR [--data-dir DIR] [--month YYYY-MM | --start TIME --end TIME]
+#                             [--workers N] [--accounts NUMBER ...] [--no-charts]
+import argparse
+import calendar
+import os
+import sys
+import time
+from array import array
+
+from FlazzCore import Account, Bank, DATA_DIR, timestamp_seconds
+from FlazzWorkers import account_pool, describe_account, entry_account, fork_available
+
+ACCOUNTS_PER_TASK = 16  # Accounts sent to a worker at a time
+CHART_DPI = 100
+
+# Per worker process: the figure and axes reused for every chart
+worker_figure = None
+worker_axes = None
+
+
+def init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+# Helper function to get the figure and axes of this worker, creating them on first use
+def get_figure():
+    global worker_figure, worker_axes
+    if worker_figure is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        worker_figure = Figure(figsize=(10, 6), dpi=CHART_DPI)
+        FigureCanvasAgg(worker_figure)
+        worker_axes = worker_figure.subplots(nrows=2, ncols=2)
+        worker_figure.subplots_adjust(wspace=0.5, hspace=0.5)
+    return worker_figure, worker_axes
+
+# Helper function to copy the transactions of an account with start <= timestamp < end, in time
+# order, into a new account that opens with the balance from before the window
+def window_account(account, start, end):
+    import numpy as np
+    from FlazzExport import gather_columns
+
+    with account.lock:
+        ledger = account.get_transaction_history()
+        first, stop = ledger.time_window(start, end)
+        window = Account(account.account_number, account.account_holder, account.opening_balance + ledger.amount_before(first))
+        amounts, timestamps, codes = gather_columns(ledger, ledger.time_indices(first, stop))
+        categories = ledger.categories[:]
+
+    # Only the categories used in the window are registered, so the chart does not list the others
+    used, codes = np.unique(codes, return_inverse=True)
+    window.record_batch(amounts.tobytes(), timestamps.tobytes(), array("H", codes.astype(np.uint16).tobytes()),
+                        [categories[code] for code in used])
+    return window
+
+# Method to render the dashboard chart of an account to a JPEG file on the worker's figure. With a
+# start or end only the transactions with start <= timestamp < end are plotted.
+def render_chart(account, path, start=None, end=None):
+    from FlazzCharts import DashboardCharts
+
+    if start is not None or end is not None:
+        account = window_account(account, start, end)
+    figure, axes = get_figure()
+    for ax in axes.flat:
+        ax.clear()
+    charts = DashboardCharts(figure, axes, account)
+    try:
+        charts.update()
+        figure.savefig(path, format="jpeg", pil_kwargs={"quality": 95})
+    finally:
+        charts.close()
+
+
+# Method to render the statements of a group of account entries (see FlazzWorkers.describe_account).
+# Returns (account number, pages, error message or None) per account.
+def render_group(group, output_dir, start, end, charts):
+    from FlazzStatement import render_statement
+
+    results = []
+    for entry in group:
+        account = entry_account(entry)
+        try:
+            pages = render_statement(account, os.path.join(output_dir, f"{account.account_number}.pdf"), start=start, end=end)
+            if charts:
+                render_chart(account, os.path.join(output_dir, f"{account.account_number}.jpg"), start, end)
+            results.append((account.account_number, pages, None))
+        except Exception as error:
+            results.append((account.account_number, 0, f"{type(error).__name__}: {error}"))
+    return results
+
+
+# Method to render the statements of all (or the given) accounts of a bank into output_dir.
+# progress(done, total) is called as groups finish. Returns the list of per-account results.
+def render_statements(bank, output_dir, account_numbers=None, start=None, end=None, workers=None, charts=True, progress=None):
+    os.makedirs(output_dir, exist_ok=True)
+    start = timestamp_seconds(start)
+    end = timestamp_seconds(end)
+    workers = workers or os.cpu_count() or 1
+    with bank.accounts_lock:
+        if account_numbers is None:
+            accounts = list(bank.accounts.values())
+        else:
+            accounts = [bank.accounts[number] for number in account_numbers]
+
+    can_fork = fork_available()
+    entries = [describe_account(account, with_columns=not can_fork) for account in accounts]
+    groups = [entries[index:index + ACCOUNTS_PER_TASK] for index in range(0, len(entries), ACCOUNTS_PER_TASK)]
+
+    results = []
+    with account_pool(bank, workers, can_fork, initializer=init_worker) as pool:
+        for group_results in pool.map(render_group, groups, [output_dir] * len(groups), [start] * len(groups),
+                                      [end] * len(groups), [charts] * len(groups)):
+            results.extend(group_results)
+            if progress is not None:
+                progress(len(results), len(entries))
+    return results
+
+
+# Helper function to get the (start, end) timestamps of a "YYYY-MM" month
+def month_window(text):
+    year, month = (int(part) for part in text.split("-"))
+    days = calendar.monthrange(year, month)[1]
+    start = calendar.timegm((year, month, 1, 0, 0, 0))
+    return start, start + days * 86400
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render Flazz card statements (PDF and chart image) for all cardholders.")
+    parser.add_argument("output_dir", help="directory to write <account>.pdf and <account>.jpg files to")
+    parser.add_argument("--data-dir", default=DATA_DIR, help=f"bank data directory (default: {DATA_DIR})")
+    parser.add_argument("--month", help="statement month as YYYY-MM")
+    parser.add_argument("--start", help="statement window start (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--end", help="statement window end, exclusive (YYYY-MM-DD HH:MM:SS)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--accounts", nargs="+", help="only these account numbers")
+    parser.add_argument("--no-charts", action="store_true", help="only render the PDF statements")
+    args = parser.parse_args(argv)
+
+    start, end = month_window(args.month) if args.month else (args.start, args.end)
+    bank = Bank("MyFlazzID", data_dir=args.data_dir)
+    try:
+        def progress(done, total):
+            print(f"\r{done:,} / {total:,} statements", end="", flush=True)
+
+        started = time.perf_counter()
+        results = render_statements(bank, args.output_dir, args.accounts, start, end, args.workers,
+                                    charts=not args.no_charts, progress=progress)
+        elapsed = time.perf_counter() - started
+    finally:
+        bank.close()
+
+    failed = [result for result in results if result[2] is not None]
+    print(f"\nRendered {len(results) - len(failed):,} statements in {elapsed:.1f}s")
+    for number, pages, error in failed:
+        print(f"{number}: {error}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
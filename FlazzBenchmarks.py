@@ -0,0 +1,214 @@
+# Micro-benchmarks for the ledger, the dashboard charts and the exporters.
+#
+# Every benchmark runs at each of the given history sizes (1e2 to 1e6 transactions by default)
+# and reports the best time of a few runs and the peak memory of one more run traced with
+# tracemalloc. Results can be saved as a baseline (a JSON file), and later runs are compared
+# against it: anything slower or bigger than the baseline by more than the tolerance is flagged
+# as a regression and makes the script exit with status 1.
+#
+# Usage: python FlazzBenchmarks.py [--sizes N ...] [--only NAME ...] [--baseline FILE]
+#                                  [--save-baseline] [--tolerance FRACTION] [--no-memory]
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+import numpy as np
+
+from FlazzCore import Account, Bank, SPENDING_CATEGORIES
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+DEFAULT_BASELINE = "benchmark_baseline.json"
+DEFAULT_TOLERANCE = 0.25  # Allowed slowdown or memory growth before a result counts as a regression
+MIN_TOTAL_TIME = 0.2  # Small sizes are repeated until their runs add up to about this many seconds
+MAX_REPEAT = 5
+
+
+# Helper function to make an account with a synthetic history of the given length
+def make_account(size, account_number="0000000000"):
+    account = Account(account_number, "Benchmark", 0)
+    categories = ["Deposit"] + SPENDING_CATEGORIES
+    codes = np.where(np.arange(size) % 4 == 0, 0, 1 + np.arange(size) % len(SPENDING_CATEGORIES)).astype(np.uint16)
+    amounts = np.where(codes == 0, 10000000, -1250000).astype(np.int64)
+    timestamps = np.arange(1_700_000_000, 1_700_000_000 + size * 600, 600, dtype=np.int64)
+    account.record_batch(amounts.tobytes(), timestamps.tobytes(), array("H", codes.tobytes()), categories)
+    return account
+
+# Helper function for a temporary output file that is removed after the run
+def temporary_path(suffix):
+    handle, path = tempfile.mkstemp(suffix=suffix)
+    os.close(handle)
+    return path
+
+
+# Benchmarks. Each one sets up its state for a size and returns the function to time, plus an
+# optional function that cleans up afterwards.
+def bench_deposit(size):
+    account = Account("0000000000", "Benchmark", 0)
+
+    def run():
+        for _ in range(size):
+            account.deposit(1000, "Deposit")
+    return run, None
+
+def bench_transfer(size):
+    bank = Bank("Benchmark")
+    bank.create_account("0000000001", "Benchmark", size * 1000)
+    bank.create_account("0000000002", "Benchmark", 0)
+
+    def run():
+        for _ in range(size):
+            bank.transfer_funds("0000000001", "0000000002", 1000)
+    return run, None
+
+def bench_update_charts(size):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from FlazzCharts import DashboardCharts
+
+    account = make_account(size)
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    charts = DashboardCharts(figure, figure.subplots(nrows=2, ncols=2), account)
+
+    # The first update of a new dashboard plots the whole history, like logging in does
+    def run():
+        charts.draw(charts.update())
+        figure.canvas.draw()
+    return run, None
+
+def bench_export_excel(size):
+    from FlazzExport import export_transactions
+
+    account = make_account(size)
+    path = temporary_path(".xlsx")
+    return (lambda: export_transactions(account, path)), (lambda: os.remove(path))
+
+def bench_export_pdf(size):
+    from FlazzStatement import render_statement
+
+    account = make_account(size)
+    path = temporary_path(".pdf")
+    return (lambda: render_statement(account, path)), (lambda: os.remove(path))
+
+BENCHMARKS = {
+    "deposit": bench_deposit,
+    "transfer_funds": bench_transfer,
+    "update_charts": bench_update_charts,
+    "export_to_excel": bench_export_excel,
+    "export_to_pdf": bench_export_pdf,
+}
+
+
+# Method to run one benchmark at one size. Returns {"time": seconds, "peak_memory": bytes or None}.
+def measure(benchmark, size, memory=True):
+    best = None
+    total = 0.0
+    runs = 0
+    while runs < MAX_REPEAT and (runs == 0 or total < MIN_TOTAL_TIME):
+        run, cleanup = benchmark(size)
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        if cleanup is not None:
+            cleanup()
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        runs += 1
+
+    peak = None
+    if memory:
+        # Tracing slows allocations down, so memory is measured on a separate, untimed run
+        run, cleanup = benchmark(size)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            if cleanup is not None:
+                cleanup()
+    return {"time": best, "peak_memory": peak}
+
+
+# Helper function to compare a result with its baseline. Returns a list of regression messages.
+def find_regressions(result, baseline, tolerance):
+    messages = []
+    if baseline is None:
+        return messages
+    if result["time"] > baseline["time"] * (1 + tolerance):
+        messages.append(f"time +{result['time'] / baseline['time'] - 1:.0%}")
+    if result["peak_memory"] is not None and baseline.get("peak_memory"):
+        if result["peak_memory"] > baseline["peak_memory"] * (1 + tolerance):
+            messages.append(f"memory +{result['peak_memory'] / baseline['peak_memory'] - 1:.0%}")
+    return messages
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as baseline_file:
+        return json.load(baseline_file)["results"]
+
+def save_baseline(path, results):
+    document = {
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as baseline_file:
+        json.dump(document, baseline_file, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Flazz ledger, charts and exporters.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="history sizes to run at")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help=f"baseline file (default: {DEFAULT_BASELINE})")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown before flagging, as a fraction")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    args = parser.parse_args(argv)
+
+    import matplotlib
+    matplotlib.use("Agg")
+
+    baseline = load_baseline(args.baseline)
+    results = dict(baseline) if args.save_baseline else {}
+    regressions = 0
+
+    print(f"{'benchmark':<16} {'size':>9} {'time (s)':>10} {'us/txn':>9} {'peak MB':>9}  vs baseline")
+    for name in args.only or BENCHMARKS:
+        for size in args.sizes:
+            key = f"{name}/{size}"
+            result = measure(BENCHMARKS[name], size, memory=not args.no_memory)
+            results[key] = result
+
+            previous = baseline.get(key)
+            change = f"{result['time'] / previous['time'] - 1:+.0%}" if previous else "-"
+            messages = find_regressions(result, previous, args.tolerance)
+            if messages:
+                regressions += 1
+                change += "  REGRESSION (" + ", ".join(messages) + ")"
+            peak = f"{result['peak_memory'] / 1e6:9.1f}" if result["peak_memory"] is not None else f"{'-':>9}"
+            print(f"{name:<16} {size:>9,} {result['time']:>10.4f} {result['time'] / size * 1e6:>9.2f} {peak}  {change}", flush=True)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+    if regressions:
+        print(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
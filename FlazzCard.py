@@ -1,14 +1,19 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib import pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-import pandas as pd
-from math import isnan
-from datetime import datetime
+import os
+from FlazzCore import DATA_DIR, TIMESTAMP_FORMAT, SPENDING_CATEGORIES, Transaction, Bank, MINOR_UNITS, parse_timestamp, parse_amount
+from FlazzJobs import JobExecutor, JobCancelled, JobLimitReached
+
+# Matplotlib, pandas and reportlab are imported on first use by the windows and exports that need them
+
+# Colors of the Tk widgets per theme (the charts have their own, see FlazzCharts.CHART_THEMES)
+THEMES = {
+    "light": {"background": "white", "text_background": "white", "foreground": "black"},
+    "dark": {"background": "#121212", "text_background": "#1E1E1E", "foreground": "white"},
+}
+
+# Metrics registry (FlazzMetrics) while hot-path instrumentation is on, see enable_metrics
+metrics = None
 
 class SetupWindow:
     def __init__(self, root, bank):
@@ -31,7 +36,7 @@ class SetupWindow:
         self.entry_account_holder = ttk.Entry(root, validate="key", validatecommand=(root.register(self.validate_full_name), "%P"), style="CustomEntry.TEntry")
 
         # Button to create an account
-        self.setup_button = ttk.Button(root, text="Create Account", command=self.setup_account, style="Custom.TButton")
+        self.setup_button = ttk.Button(root, text="Register / Login", command=self.setup_account, style="Custom.TButton")
 
         # Grid layout for the GUI elements
         self.account_number_label.grid(row=0, column=0, pady=10, padx=10, sticky="w")
@@ -60,7 +65,13 @@ class SetupWindow:
             initial_balance = 0
             account = self.bank.create_account(account_number, account_holder, initial_balance)
 
-            # If account creation is successful, launch the main application
+            # Log in to a saved account when the number and name match
+            if account is None:
+                existing = self.bank.get_account(account_number)
+                if existing.account_holder == account_holder:
+                    account = existing
+
+            # If account creation or login is successful, launch the main application
             if account:
                 self.root.destroy()
                 app = FlazzCardApp(tk.Tk(), self.bank, account)
@@ -72,85 +83,95 @@ class SetupWindow:
             messagebox.showinfo("Invalid Information", "Please provide a valid 10-digit Binusian ID number and account Full name.")
 
 
-# Define a class to represent individual transactions
-class Transaction:
-    def __init__(self, amount, timestamp, category):
-        # Initialize transaction attributes
-        self.amount = amount  # Transaction amount (positive for deposits, negative for withdrawals)
-        self.timestamp = timestamp  # Timestamp when the transaction occurred
-        self.category = category  # Category of the transaction (e.g., "Toll Road", "Supermarket")
-
-    def __str__(self):
-        # String representation of the transaction for display purposes
-        return f"{self.category}: {self.format_currency(self.amount)} IDR at {self.timestamp}"
-
-    @staticmethod
-    def format_currency(amount):
-        # Helper method to format currency with commas and two decimal places
-        return "{:,.2f}".format(amount)
-
-# Define a class to represent a bank account
-class Account:
-    def __init__(self, account_number, account_holder, balance):
-        # Initialize account attributes
-        self.account_number = account_number  # Unique identifier for the account
-        self.account_holder = account_holder  # Full name of the account holder
-        self.balance = balance  # Current balance in the account
-        self.transactions = []  # List to store transaction history
-
-    def deposit(self, amount, category):
-        # Deposit funds into the account
-        self.balance += amount
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        transaction = Transaction(amount, timestamp, category)
-        self.transactions.append(transaction)
-
-    def withdraw(self, amount, category):
-        # Withdraw funds from the account if there are sufficient funds
-        if amount <= self.balance:
-            self.balance -= amount
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            transaction = Transaction(-amount, timestamp, category)
-            self.transactions.append(transaction)
+# Define a widget that shows the transaction history as a virtual list. Only the rows in view
+# are formatted, and new transactions are appended without re-rendering the rest.
+class TransactionHistoryView(tk.Frame):
+    def __init__(self, master, height=10, width=50):
+        super().__init__(master)
+        self.rows = height  # Number of visible rows
+
+        self.text = tk.Text(self, height=height, width=width, wrap="none")
+        self.text.config(state="disabled")
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.text.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        # The Text widget only ever holds the visible rows, so scrolling is handled here
+        self.text.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.text.bind("<Button-4>", lambda event: self.scroll_rows(-1))
+        self.text.bind("<Button-5>", lambda event: self.scroll_rows(1))
+
+        self.transactions = []  # Any sequence of transactions, e.g. an account's TransactionLedger
+        self.first = 0  # Index of the first visible transaction
+        self.last = 0  # Index after the last rendered transaction
+        self.follow = True  # Keep showing the newest transactions while scrolled to the bottom
+
+    # Method to show a (possibly different) sequence of transactions
+    def set_transactions(self, transactions):
+        if transactions is not self.transactions:
+            self.transactions = transactions
+            self.follow = True
+            self.render(max(0, len(transactions) - self.rows))
         else:
-            # Display a message for insufficient funds
-            messagebox.showinfo("Insufficient Funds", "Insufficient funds.")
-
-    def get_balance(self):
-        # Get the current balance of the account
-        return self.balance
-
-    def get_transaction_history(self):
-        # Get the transaction history of the account
-        return self.transactions
-
-# Define a class to represent a bank
-class Bank:
-    def __init__(self, bank_name):
-        # Initialize bank attributes
-        self.bank_name = bank_name  # Name of the bank
-        self.accounts = {}  # Dictionary to store accounts (account_number: Account)
-
-    def create_account(self, account_number, account_holder, initial_balance):
-        # Create a new account if the account number is unique
-        if account_number not in self.accounts:
-            account = Account(account_number, account_holder, initial_balance)
-            self.accounts[account_number] = account
-            return account
-        return None
-
-    def get_account(self, account_number):
-        # Get the account associated with a given account number
-        return self.accounts.get(account_number)
-
-    def transfer_funds(self, from_account, to_account, amount):
-        # Transfer funds from one account to another if there are sufficient funds
-        if from_account in self.accounts and to_account in self.accounts:
-            if self.accounts[from_account].balance >= amount:
-                self.accounts[from_account].withdraw(amount, "Transfer")
-                self.accounts[to_account].deposit(amount, "Transfer")
-                return True
-        return False
+            self.refresh()
+
+    # Method to pick up transactions appended since the last refresh
+    def refresh(self):
+        count = len(self.transactions)
+        if not self.follow:
+            self.update_scrollbar()
+            return
+
+        first = max(0, count - self.rows)
+        added = count - self.last
+        if 0 <= added < self.rows and self.first <= first <= self.last:
+            # Drop rows that scrolled out at the top and format only the new ones
+            self.text.config(state="normal")
+            if first > self.first:
+                self.text.delete("1.0", f"{first - self.first + 1}.0")
+            self.text.insert("end-1c", "".join(str(self.transactions[i]) + "\n" for i in range(self.last, count)))
+            self.text.config(state="disabled")
+            self.first, self.last = first, count
+            self.update_scrollbar()
+        else:
+            self.render(first)
+
+    # Method to format and show the rows starting at the given index
+    def render(self, first):
+        count = len(self.transactions)
+        first = max(0, min(first, count - self.rows))
+        last = min(count, first + self.rows)
+
+        self.text.config(state="normal")
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", "".join(str(self.transactions[i]) + "\n" for i in range(first, last)))
+        self.text.config(state="disabled")
+
+        self.first, self.last = first, last
+        self.follow = last >= count
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        count = len(self.transactions)
+        if count:
+            self.scrollbar.set(self.first / count, self.last / count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll_rows(self, rows):
+        self.render(self.first + rows)
+        return "break"
+
+    def on_mouse_wheel(self, event):
+        return self.scroll_rows(-1 if event.delta > 0 else 1)
+
+    # Scrollbar callback: ("moveto", fraction) or ("scroll", number, "units" / "pages")
+    def on_scroll(self, action, value, unit=None):
+        if action == "moveto":
+            self.render(int(float(value) * len(self.transactions)))
+        elif action == "scroll":
+            step = self.rows if unit == "pages" else 1
+            self.scroll_rows(int(value) * step)
 
 #define a class to represent the main application for flazz card usage
 class FlazzCardApp:
@@ -169,20 +190,25 @@ class FlazzCardApp:
 
         self.use_money_label = tk.Label(root, text="Select Category:")
         self.category_menu = ttk.Combobox(root, textvariable=self.selected_category,
-            values=["Toll Road", "Public Transportation", "Supermarket", "Gas Station","Recreational", "Other"])
+            values=SPENDING_CATEGORIES)
         self.category_menu.bind("<<ComboboxSelected>>", self.select_category)
         self.use_money_button = tk.Button(root, text="Use Money", command=self.use_money, bg="red", fg="white")
 
         #GUI elements for displaying the transaction history
         self.history_label = tk.Label(root, text="Transaction History")
-        self.history_text = tk.Text(root, height=10, width=50)
-        self.history_text.config(state="disabled")
+        self.history_view = TransactionHistoryView(root, height=10, width=50)
+        self.history_text = self.history_view.text
 
         #GUI elements for displaying the remaining transactions balance information
         self.balance_label = tk.Label(root, text=f"Remaining Balance: {self.format_currency(self.account.get_balance())} IDR", font=("Helvetica", 16, "bold"))
 
         #matplotlib charts and canvas
-        self.figure, self.ax = plt.subplots(nrows=2, ncols=2, figsize=(10, 6))
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from FlazzCharts import DashboardCharts
+
+        self.figure = Figure(figsize=(10, 6))
+        self.ax = self.figure.subplots(nrows=2, ncols=2)
         self.canvas = FigureCanvasTkAgg(self.figure, master=root)
         self.canvas_widget = self.canvas.get_tk_widget()
 
@@ -195,7 +221,7 @@ class FlazzCardApp:
         self.use_money_button.grid(row=1, column=2, pady=10, padx=10)
 
         self.history_label.grid(row=2, column=0, columnspan=3, pady=20)
-        self.history_text.grid(row=3, column=0, columnspan=3, pady=10, padx=10, sticky="w")
+        self.history_view.grid(row=3, column=0, columnspan=3, pady=10, padx=10, sticky="w")
 
         self.balance_label.grid(row=4, column=0, columnspan=3, pady=10, padx=10)
 
@@ -222,64 +248,46 @@ class FlazzCardApp:
         self.full_chart_button = tk.Button(root, text="Full Transaction History Chart", command=self.show_full_chart)
         self.full_chart_button.grid(row=6, column=0, pady=10, padx=5)
 
+        # Diagnostics window with the latency stats, while instrumentation is on
+        if metrics is not None:
+            self.diagnostics_button = tk.Button(root, text="Diagnostics", command=self.show_diagnostics)
+            self.diagnostics_button.grid(row=6, column=1, pady=10, padx=5)
+
+        # Background jobs for exports and chart saves, with their progress and a cancel button
+        self.jobs = JobExecutor(root)
+        self.job_status = {}
+        self.job_status_label = tk.Label(root, text="")
+        self.job_status_label.grid(row=7, column=0, columnspan=2, pady=5, padx=10, sticky="w")
+        self.cancel_jobs_button = tk.Button(root, text="Cancel Export", command=self.jobs.cancel_all, state="disabled")
+        self.cancel_jobs_button.grid(row=7, column=2, pady=5, padx=5)
+
         # adjusting layout and applying initial themes
         self.figure.subplots_adjust(wspace=0.5, hspace=0.5)
+        self.charts = DashboardCharts(self.figure, self.ax, self.account)
+        self.chart_update_pending = False
         self.dark_mode = False
         self.apply_theme()
+        self.update_history()
+        self.update_charts()
 
     # method to toggle between dark and light mode   
     def toggle_dark_mode(self):
         self.dark_mode = not self.dark_mode
         self.apply_theme()
 
-    # Method to apply the selected theme (dark or light)
+    # Method to apply the selected theme (dark or light). Widgets and chart artists are only
+    # recolored; no chart data is recomputed or replotted.
     def apply_theme(self):
-        # Theme settings for various GUI elements and charts
-        if self.dark_mode:
-            self.root.configure(bg="#121212")  
-            self.history_text.config(bg="#1E1E1E", fg="white")  
-            self.balance_label.config(bg="#121212", fg="white") 
-
-            for ax_row in self.ax:
-                for ax in ax_row:
-                    ax.set_facecolor("#121212")
-                    ax.tick_params(axis='x', colors='white')
-                    ax.tick_params(axis='y', colors='white')
-                    ax.title.set_color('white')
-                    ax.xaxis.label.set_color('white')
-                    ax.yaxis.label.set_color('white')
-
-            self.canvas_widget.config(bg="#121212") 
-
-        else:
-            self.root.configure(bg="white")
-            self.history_text.config(bg="white", fg="black")
-            self.balance_label.config(bg="white", fg="black")
-
-            for ax_row in self.ax:
-                for ax in ax_row:
-                    ax.set_facecolor("white")
-                    ax.tick_params(axis='x', colors='black')
-                    ax.tick_params(axis='y', colors='black')
-                    ax.title.set_color('black')
-                    ax.xaxis.label.set_color('black')
-                    ax.yaxis.label.set_color('black')
-
-            self.canvas_widget.config(bg="white")
-
-        self.update_charts()
-        
-        for ax_row in self.ax:
-            for ax in ax_row:
-                ax.title.set_bbox(dict(boxstyle="round,pad=0.3", edgecolor="black", facecolor="w"))
-
-        for ax_row in self.ax:
-            for ax in ax_row:
-                ax.tick_params(axis='x', which='both', bottom=False, top=False, labelbottom=True)
-                ax.set_xticks(ax.get_xticks())
-                ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
-
-        self.update_charts()
+        name = "dark" if self.dark_mode else "light"
+        theme = THEMES[name]
+        self.root.configure(bg=theme["background"])
+        self.history_text.config(bg=theme["text_background"], fg=theme["foreground"])
+        self.balance_label.config(bg=theme["background"], fg=theme["foreground"])
+        self.job_status_label.config(bg=theme["background"], fg=theme["foreground"])
+        self.canvas_widget.config(bg=theme["background"])
+
+        self.charts.apply_theme(name)
+        self.canvas.draw_idle()
         self.root.grid_rowconfigure(0, weight=1)
         self.root.grid_columnconfigure(3, weight=1)
         
@@ -289,31 +297,41 @@ class FlazzCardApp:
         full_chart_page = FullChartPage(full_chart_root, self.bank, self.account)
         full_chart_root.mainloop()
 
+    # Method to show the diagnostics window
+    def show_diagnostics(self):
+        DiagnosticsWindow(tk.Toplevel(self.root), metrics)
+
     # Method to add money to the account
     def add_money(self):
         amount_str = self.entry_add_money.get()
 
         try:
-            amount = float(amount_str)
+            amount = parse_amount(amount_str)
 
-            if amount >= 0:
+            if amount > 0:
                 category = "Deposit"
                 self.account.deposit(amount, category)
                 self.update_history()
                 self.update_balance()
                 self.update_charts()
             else:
-                messagebox.showinfo("Invalid Amount", "Please enter a non-negative amount.")
+                messagebox.showinfo("Invalid Amount", "Please enter a positive amount.")
         except ValueError:
             messagebox.showinfo("Invalid Amount", "Please enter a valid numeric amount.")
 
     # Method to use money from the account
     def use_money(self):
-        amount = float(self.entry_add_money.get())
+        try:
+            amount = parse_amount(self.entry_add_money.get())
+        except ValueError:
+            messagebox.showinfo("Invalid Amount", "Please enter a valid numeric amount.")
+            return
+        if amount <= 0:
+            messagebox.showinfo("Invalid Amount", "Please enter a positive amount.")
+            return
         category = self.selected_category.get()
-        if not isnan(amount) and category:
-            if self.account.get_balance() >= amount:
-                self.account.withdraw(amount, category)
+        if category:
+            if self.account.withdraw(amount, category):
                 self.update_history()
                 self.update_balance()
                 self.update_charts()
@@ -338,132 +356,105 @@ class FlazzCardApp:
 
     # Method to display transactions in the history text box
     def display_transactions(self, transactions):
-        self.history_text.config(state="normal")
-        self.history_text.delete(1.0, tk.END)
-        for transaction in transactions:
-            self.history_text.insert(tk.END, str(transaction) + "\n")
-        self.history_text.config(state="disabled")
+        self.history_view.set_transactions(transactions)
 
-    # Method to update the charts based on transaction history
+    # Method to update the charts based on transaction history. Updates requested in a burst
+    # are merged into a single refresh once Tk is idle.
     def update_charts(self):
-        self.update_spending_pattern_chart()
-        self.update_deposit_chart()
-        self.update_spending_chart()
-        self.update_stats_chart()
-
-    # Methods to "update" each specific charts
-    def update_spending_pattern_chart(self):
-        categories = []
-        spending = []
-
-        for transaction in self.account.get_transaction_history():
-            if transaction.category not in categories:
-                categories.append(transaction.category)
-                spending.append(0)
-
-            category_index = categories.index(transaction.category)
-            spending[category_index] += transaction.amount
-
-        self.ax[0, 0].clear()
-        self.ax[0, 0].plot(categories, spending, marker='o', color='blue', linestyle='-', linewidth=2)
-        self.ax[0, 0].set_title('Spending Pattern')
-        self.ax[0, 0].set_xlabel('Categories')
-        self.ax[0, 0].set_ylabel('Total Spending (IDR)')
-
-    def update_deposit_chart(self):
-        deposit_dates = [transaction.timestamp for transaction in self.account.get_transaction_history() if transaction.amount > 0]
-        deposit_amounts = [transaction.amount for transaction in self.account.get_transaction_history() if transaction.amount > 0]
-
-        self.ax[0, 1].clear()
-        self.ax[0, 1].plot(deposit_dates, deposit_amounts, marker='o', color='green', linestyle='-', linewidth=2)
-        self.ax[0, 1].set_title('Deposit History')
-        self.ax[0, 1].set_xlabel('Timestamp')
-        self.ax[0, 1].set_ylabel('Deposit Amount (IDR)')
-
-    def update_spending_chart(self):
-        spending_dates = [transaction.timestamp for transaction in self.account.get_transaction_history() if transaction.amount < 0]
-        spending_amounts = [abs(transaction.amount) for transaction in self.account.get_transaction_history() if transaction.amount < 0]
-
-        self.ax[1, 0].clear()
-        self.ax[1, 0].plot(spending_dates, spending_amounts, marker='o', color='red', linestyle='-', linewidth=2)
-        self.ax[1, 0].set_title('Spending History')
-        self.ax[1, 0].set_xlabel('Timestamp')
-        self.ax[1, 0].set_ylabel('Spending Amount (IDR)')
-
-    def update_stats_chart(self):
-        stats_dates = [transaction.timestamp for transaction in self.account.get_transaction_history()]
-        stats_balance = [transaction.amount for transaction in self.account.get_transaction_history()]
-
-        self.ax[1, 1].clear()
-        self.ax[1, 1].plot(stats_dates, stats_balance, marker='o', color='purple', linestyle='-', linewidth=2)
-        self.ax[1, 1].set_title('Transaction Statistics')
-        self.ax[1, 1].set_xlabel('Timestamp')
-        self.ax[1, 1].set_ylabel('Transaction Amount (IDR)')
-
-        self.canvas.draw()
-
-    # Method to export transaction history to Excel
+        if not self.chart_update_pending:
+            self.chart_update_pending = True
+            self.root.after_idle(self.flush_charts)
+
+    # Method to apply pending chart updates right away
+    def flush_charts(self):
+        self.chart_update_pending = False
+        self.charts.draw(self.charts.update())
+
+    # Method to export transaction history to Excel (or CSV / Parquet, picked by file type)
     def export_to_excel(self):
-        file_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx")])
+        file_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("Parquet files", "*.parquet")])
 
         if file_path:
-            transactions = self.account.get_transaction_history()
-            data = {"Category": [], "Amount": [], "Timestamp": []}
-
-            for transaction in transactions:
-                data["Category"].append(transaction.category)
-                data["Amount"].append(transaction.amount)
-                data["Timestamp"].append(transaction.timestamp)
+            from FlazzExport import export_transactions
 
-            df = pd.DataFrame(data)
-            df["Remaining Balance"] = [self.account.get_balance()] * len(df)
-            df.to_excel(file_path, index=False)
-            messagebox.showinfo("Export Successful", f"Transaction history exported to {file_path}")
+            self.run_job("Exporting history", lambda job: export_transactions(self.account, file_path, progress=job.report),
+                         file_path, "Export Successful", f"Transaction history exported to {file_path}")
 
     # Method to export transaction history to PDF
     def export_to_pdf(self):
         file_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF files", "*.pdf")])
 
         if file_path:
-            transactions = self.account.get_transaction_history()
+            from FlazzStatement import render_statement
 
-            pdf = canvas.Canvas(file_path, pagesize=letter)
-            pdf.setFont("Helvetica", 12)
-
-            pdf.drawString(100, 750, "Transaction History")
-            pdf.drawString(100, 730, "-------------------") # As a seperator
-
-            y_position = 710
-            for transaction in transactions:
-                pdf.drawString(100, y_position, str(transaction))
-                y_position -= 20
-
-            pdf.save()
-
-            messagebox.showinfo("Export Successful", f"Transaction history exported to {file_path}")
+            self.run_job("Exporting PDF", lambda job: render_statement(self.account, file_path, progress=job.report),
+                         file_path, "Export Successful", f"Transaction history exported to {file_path}")
 
     # Method to save the chart as a JPEG file
     def save_chart_as_jpeg(self):
         file_path = filedialog.asksaveasfilename(defaultextension=".jpg", filetypes=[("JPEG files", "*.jpg")])
 
         if file_path:
-            self.figure.savefig(file_path, format="jpeg")
-            messagebox.showinfo("Save Successful", f"Chart saved as {file_path}")
+            import numpy as np
+            from PIL import Image
+
+            # The figure belongs to the Tk thread, so it is rendered here and only encoded in the background
+            self.flush_charts()
+            self.canvas.draw()
+            pixels = np.array(self.canvas.buffer_rgba())
+            dpi = self.figure.dpi
+
+            def save(job):
+                Image.fromarray(pixels).convert("RGB").save(file_path, "JPEG", quality=95, dpi=(dpi, dpi))
+
+            self.run_job("Saving chart", save, file_path, "Save Successful", f"Chart saved as {file_path}")
+
+    # Method to run function(job) in the background, showing its progress and a message when done.
+    # A cancelled or failed job removes the partly written file.
+    def run_job(self, name, function, file_path, title, message):
+        def on_progress(job, done, total):
+            self.set_job_status(job, f"{job.name}: {done * 100 // max(total, 1)}%")
+
+        def on_done(job, result):
+            self.set_job_status(job, None)
+            messagebox.showinfo(title, message)
+
+        def on_error(job, error):
+            self.set_job_status(job, None)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            if not isinstance(error, JobCancelled):
+                messagebox.showinfo("Export Failed", f"{job.name} failed: {error}")
+
+        try:
+            job = self.jobs.submit(name, function, on_progress=on_progress, on_done=on_done, on_error=on_error)
+        except JobLimitReached:
+            messagebox.showinfo("Please Wait", "Too many exports are running. Please wait for one to finish.")
+            return
+        self.set_job_status(job, f"{name}...")
+
+    # Method to show (or clear, with text None) the status line of a background job
+    def set_job_status(self, job, text):
+        if text is None:
+            self.job_status.pop(job, None)
+        else:
+            self.job_status[job] = text
+        self.job_status_label.config(text="   ".join(self.job_status.values()))
+        self.cancel_jobs_button.config(state="normal" if self.job_status else "disabled")
 
     # Method to handle logout
     def logout(self):
-        answer = simpledialog.askstring("Warning", "Are you sure you want to log out?\nAll transaction history will be deleted.\nType 'yes' to confirm:", parent=self.root)
+        answer = simpledialog.askstring("Warning", "Are you sure you want to log out?\nType 'yes' to confirm:", parent=self.root)
         if answer == 'yes':
+            # The bank keeps the account and its history, so it is handed back to the login window
+            self.jobs.shutdown()
             self.root.destroy()
             root_setup = tk.Tk()
-            bank_setup = Bank("MyFlazzID")
-            setup_window = SetupWindow(root_setup, bank_setup)
+            setup_window = SetupWindow(root_setup, self.bank)
             root_setup.mainloop()
 
-    # Static method to format currency
-    @staticmethod
-    def format_currency(amount):
-        return "{:,.2f}".format(amount)
+    # Static method to format currency (amounts in minor units)
+    format_currency = staticmethod(Transaction.format_currency)
 
 # Define a class for displaying the full transaction history chart page
 class FullChartPage:
@@ -481,19 +472,36 @@ class FullChartPage:
         self.danger_zone_label = tk.Label(root, text="Enter Danger Zone (IDR):")
         self.entry_danger_zone = tk.Entry(root)
 
+        # Optional time window of the chart; empty entries leave that end open
+        self.window_start_label = tk.Label(root, text=f"From ({TIMESTAMP_FORMAT}, optional):")
+        self.entry_window_start = tk.Entry(root)
+
+        self.window_end_label = tk.Label(root, text=f"Until ({TIMESTAMP_FORMAT}, optional):")
+        self.entry_window_end = tk.Entry(root)
+
         self.check_zone_button = tk.Button(root, text="Check Zone", command=self.check_zone)
 
         # Matplotlib chart and canvas for displaying the full transaction history
-        self.full_chart_figure, self.full_chart_ax = plt.subplots(figsize=(10, 6))
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.figure import Figure
+
+        self.full_chart_figure = Figure(figsize=(10, 6))
+        self.full_chart_ax = self.full_chart_figure.subplots()
         self.full_chart_canvas = FigureCanvasTkAgg(self.full_chart_figure, master=root)
         self.full_chart_canvas_widget = self.full_chart_canvas.get_tk_widget()
 
-        # Variables to store safe and danger zones
+        # Toolbar for zooming and panning; zooming in shows the points the downsampled line left out
+        self.full_chart_toolbar = NavigationToolbar2Tk(self.full_chart_canvas, root, pack_toolbar=False)
+        self.full_chart_line = None
+
+        # Variables to store safe and danger zones and the time window
         self.safe_zone = None
         self.danger_zone = None
+        self.window_start = None
+        self.window_end = None
 
-        # Label to display safe and danger zones
-        self.safe_danger_label = tk.Label(root, text="")
+        # Label to display how often and how long the balance stayed below the safe and danger zones
+        self.safe_danger_label = tk.Label(root, text="", justify="left")
 
         # Layout configuration
         self.safe_zone_label.grid(row=0, column=0, pady=10, padx=10, sticky="w")
@@ -502,9 +510,17 @@ class FullChartPage:
         self.danger_zone_label.grid(row=1, column=0, pady=10, padx=10, sticky="w")
         self.entry_danger_zone.grid(row=1, column=1, pady=10, padx=10)
 
-        self.check_zone_button.grid(row=2, column=0, columnspan=2, pady=10)
+        self.window_start_label.grid(row=2, column=0, pady=10, padx=10, sticky="w")
+        self.entry_window_start.grid(row=2, column=1, pady=10, padx=10)
+
+        self.window_end_label.grid(row=3, column=0, pady=10, padx=10, sticky="w")
+        self.entry_window_end.grid(row=3, column=1, pady=10, padx=10)
+
+        self.check_zone_button.grid(row=4, column=0, columnspan=2, pady=10)
 
-        self.full_chart_canvas_widget.grid(row=3, column=0, columnspan=2, pady=10, padx=20, sticky="nsew")
+        self.full_chart_canvas_widget.grid(row=5, column=0, columnspan=2, pady=10, padx=20, sticky="nsew")
+        self.full_chart_toolbar.grid(row=6, column=0, columnspan=2, padx=20, sticky="ew")
+        self.safe_danger_label.grid(row=7, column=0, columnspan=2, pady=10, padx=20, sticky="w")
 
         self.full_chart_figure.subplots_adjust(wspace=0.5, hspace=0.5)
 
@@ -514,34 +530,75 @@ class FullChartPage:
         danger_zone_str = self.entry_danger_zone.get()
 
         try:
-            self.safe_zone = float(safe_zone_str)
-            self.danger_zone = float(danger_zone_str)
+            self.safe_zone = parse_amount(safe_zone_str)
+            self.danger_zone = parse_amount(danger_zone_str)
 
             if self.safe_zone < 0 or self.danger_zone < 0:
                 messagebox.showinfo("Invalid Zone", "Please enter non-negative values.")
-            else:
-                self.plot_full_chart()  # Call the plot_full_chart method
+                return
         except ValueError:
             messagebox.showinfo("Invalid Zone", "Please enter valid numeric values.")
+            return
+
+        window_start_str = self.entry_window_start.get().strip()
+        window_end_str = self.entry_window_end.get().strip()
+        try:
+            self.window_start = parse_timestamp(window_start_str) if window_start_str else None
+            self.window_end = parse_timestamp(window_end_str) if window_end_str else None
+        except ValueError:
+            messagebox.showinfo("Invalid Window", f"Please enter timestamps as {TIMESTAMP_FORMAT}.")
+            return
 
-    # Method to plot the full chart
+        self.plot_full_chart()  # Call the plot_full_chart method
+
+    # Method to plot the full chart: the running balance, with the stretches spent below the
+    # safe and danger zones highlighted
     def plot_full_chart(self):
-        # Get the transaction history from the account
-        transactions = self.account.get_transaction_history()
+        import numpy as np
+        from matplotlib.collections import PolyCollection
+        from FlazzAnalysis import running_balance, find_breaches, format_duration
+        from FlazzCharts import DownsampledLine, date_numbers, use_date_axis
 
-        # Extract dates and amounts from transactions
-        dates = [transaction.timestamp for transaction in transactions]
-        amounts = [transaction.amount for transaction in transactions]
+        # Compute the balance after every transaction in the chosen window, and the zone breaches
+        # (in minor units); the chart shows rupiah
+        timestamps, balances = running_balance(self.account, self.window_start, self.window_end)
+        breaches = find_breaches(timestamps, balances, {"Safe Zone": self.safe_zone, "Danger Zone": self.danger_zone})
+        balances = balances / MINOR_UNITS
 
         # Clear the existing content of the chart
         self.full_chart_ax.clear()
 
-        # Plot the transaction amounts over time
-        self.full_chart_ax.plot(dates, amounts, marker='o', color='black', linestyle='-', linewidth=2)
-
-        # Add horizontal lines for the safe and danger zones
-        self.full_chart_ax.axhline(self.safe_zone, color='green', linestyle='--', label='Safe Zone')
-        self.full_chart_ax.axhline(self.danger_zone, color='red', linestyle='--', label='Danger Zone')
+        # Plot the balance over time. The line only draws about two points per pixel column, and
+        # picks them again for the visible range after every zoom.
+        line, = self.full_chart_ax.plot([], [], marker='o', color='black', linestyle='-', linewidth=2, label='Balance')
+        self.full_chart_line = DownsampledLine(line)
+        dates = date_numbers(timestamps)
+        if len(balances):
+            self.full_chart_ax.update_datalim(np.column_stack((dates, balances)))
+            self.full_chart_ax.autoscale_view()
+        self.full_chart_line.set_data(dates, balances)
+        use_date_axis(self.full_chart_ax)
+        self.full_chart_ax.tick_params(axis='x', labelrotation=30)
+
+        # Add horizontal lines for the safe and danger zones, and shade every breach of them with
+        # one collection per zone (x in data coordinates, y spanning the whole axes)
+        summary = []
+        for name, color in (("Safe Zone", "green"), ("Danger Zone", "red")):
+            zone = breaches[name]
+            self.full_chart_ax.axhline(zone.threshold / MINOR_UNITS, color=color, linestyle='--', label=name)
+            spans = [((start, 0), (start, 1), (end, 1), (end, 0))
+                     for start, end in zip(date_numbers(zone.start_times).tolist(), date_numbers(zone.end_times).tolist())]
+            self.full_chart_ax.add_collection(PolyCollection(spans, facecolor="orange" if name == "Safe Zone" else color,
+                                                             alpha=0.2, edgecolor="none",
+                                                             transform=self.full_chart_ax.get_xaxis_transform()), autolim=False)
+            text = f"Below {name} ({Transaction.format_currency(zone.threshold)} IDR): {zone.count} time(s)"
+            if zone.count:
+                text += (f", {format_duration(zone.total_duration)} in total, longest {format_duration(zone.longest_duration)},"
+                         f" lowest {Transaction.format_currency(zone.lowest.min())} IDR")
+                if zone.ongoing[-1]:
+                    text += " - still below now"
+            summary.append(text)
+        self.safe_danger_label.config(text="\n".join(summary))
 
         # Add legend to the chart
         self.full_chart_ax.legend()
@@ -549,13 +606,73 @@ class FullChartPage:
         # Set title and labels for the axes
         self.full_chart_ax.set_title('Full Transaction History')
         self.full_chart_ax.set_xlabel('Timestamp')
-        self.full_chart_ax.set_ylabel('Transaction Amount (IDR)')
+        self.full_chart_ax.set_ylabel('Balance (IDR)')
 
-        # Draw the updated chart on the canvas
+        # Draw the updated chart on the canvas, and make the toolbar's home view this plot
         self.full_chart_canvas.draw()
+        self.full_chart_toolbar.update()
+
+# Define a class for the diagnostics window: the latency stats of the instrumented operations,
+# refreshed every second
+class DiagnosticsWindow:
+    def __init__(self, root, metrics, refresh_interval=1000):
+        self.root = root
+        self.root.title("Diagnostics")
+        self.metrics = metrics
+        self.refresh_interval = refresh_interval
+
+        self.stats_text = tk.Text(root, height=16, width=100, font=("Courier", 10), state="disabled")
+        self.reset_button = tk.Button(root, text="Reset", command=self.reset)
+        self.dump_button = tk.Button(root, text="Dump to Console", command=self.dump)
+
+        self.stats_text.grid(row=0, column=0, columnspan=2, pady=10, padx=10, sticky="nsew")
+        self.reset_button.grid(row=1, column=0, pady=10, padx=10)
+        self.dump_button.grid(row=1, column=1, pady=10, padx=10)
+        self.root.grid_rowconfigure(0, weight=1)
+        self.root.grid_columnconfigure(0, weight=1)
+
+        self.refresh()
+
+    def refresh(self):
+        if not self.root.winfo_exists():
+            return
+        self.stats_text.config(state="normal")
+        self.stats_text.delete("1.0", tk.END)
+        self.stats_text.insert(tk.END, self.metrics.dump())
+        self.stats_text.config(state="disabled")
+        self.root.after(self.refresh_interval, self.refresh)
+
+    def reset(self):
+        self.metrics.reset()
+
+    def dump(self):
+        print(self.metrics.dump(), flush=True)
+
+
+# Method to turn on hot-path instrumentation: the core operations plus the history view, the
+# chart updates and canvas draws of the app, and counts of blitted and full chart redraws
+def enable_metrics():
+    global metrics
+    import FlazzCharts
+    import FlazzMetrics
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    from FlazzCharts import DashboardCharts
+
+    metrics = FlazzMetrics.enable()
+    FlazzCharts.metrics = metrics
+    metrics.instrument(FlazzCardApp, "display_transactions")
+    metrics.instrument(FlazzCardApp, "flush_charts", "FlazzCardApp.update_charts")
+    metrics.instrument(DashboardCharts, "update")
+    metrics.instrument(DashboardCharts, "draw")
+    metrics.instrument(FigureCanvasTkAgg, "draw", "canvas.draw")
+    return metrics
 
 if __name__ == "__main__":
+    from FlazzMetrics import enabled_by_environment
+    if enabled_by_environment():
+        enable_metrics()
     root_setup = tk.Tk()
-    bank_setup = Bank("MyFlazzID")
+    bank_setup = Bank("MyFlazzID", data_dir=DATA_DIR)
     setup_window = SetupWindow(root_setup, bank_setup)
-    root_setup.mainloop()
\ No newline at end of file
+    root_setup.mainloop()
+    bank_setup.close()
\ No newline at end of file
@@ -0,0 +1,324 @@
+# Dashboard charts of the Flazz card application. Matplotlib objects are passed in, so this
+# module works with the Tk canvas of the app as well as with a headless Agg canvas.
+#
+# Time series lines never hand all their points to matplotlib: a DownsampledLine keeps the full
+# data and draws the lowest and highest point per pixel column of the visible x range, so draw
+# time depends on the width of the axes rather than on the length of the history. Amounts are
+# plotted in rupiah, converted from the ledger's minor units, against a numeric date axis: the
+# timestamp arrays are converted to matplotlib date numbers in one go, and the ticks are placed
+# by an AutoDateLocator, so the tick layout does not depend on the number of points.
+import numpy as np
+import matplotlib.dates as mdates
+
+from FlazzCore import DAY, MINOR_UNITS
+
+# Colors of the chart themes. A theme only restyles existing artists, see DashboardCharts.apply_theme.
+CHART_THEMES = {
+    "light": {"figure": "white", "axes": "white", "text": "black", "title_box": "white", "edges": "black"},
+    "dark": {"figure": "#121212", "axes": "#121212", "text": "white", "title_box": "#1E1E1E", "edges": "white"},
+}
+
+RAW_POINTS_LIMIT = 2000  # Histories up to this many transactions are plotted transaction by transaction
+# Longer histories are plotted from the account's rollups, at the finest resolution that covers
+# their time span with a few hundred points
+ROLLUP_SPANS = [("day", 400 * DAY), ("week", 8 * 366 * DAY), ("month", None)]
+# Share of the data range left free past the data when view limits grow (see DashboardCharts.grow_limits)
+LIMIT_HEADROOM = 0.25
+
+# Metrics registry (FlazzMetrics) while hot-path instrumentation is on, see FlazzCard.enable_metrics.
+# DashboardCharts.draw counts its blitted and full redraws in it.
+metrics = None
+
+
+# Helper function to pick a shape-preserving subset of points: the first and last point plus the
+# lowest and highest point of each of `buckets` equal runs of points. Returns sorted indices into y.
+def minmax_indices(y, buckets):
+    count = len(y)
+    if count <= 2 * buckets + 2:
+        return np.arange(count)
+
+    size = -(-count // buckets)  # Points per bucket
+    full = count // size * size
+    blocks = y[:full].reshape(-1, size)
+    offsets = np.arange(0, full, size)
+    picks = [offsets + blocks.argmin(axis=1), offsets + blocks.argmax(axis=1), [0, count - 1]]
+    if full < count:
+        tail = y[full:]
+        picks.append([full + tail.argmin(), full + tail.argmax()])
+    return np.unique(np.concatenate(picks))
+
+# Helper function to convert an array of second timestamps (see FlazzCore.current_timestamp) to
+# matplotlib date numbers
+def date_numbers(timestamps):
+    return mdates.date2num(np.asarray(timestamps, dtype=np.int64).astype("datetime64[s]"))
+
+# Helper function to give an axes a date x axis with automatically placed, concisely labelled ticks
+def use_date_axis(ax):
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+
+# Define a class for a line whose points are downsampled to the pixel width of its axes. The
+# points are kept sorted by x; points given out of order are sorted in (keeping the order of
+# equal x values). The visible points are picked again whenever the x limits change, so zooming
+# in shows more detail.
+class DownsampledLine:
+    def __init__(self, line):
+        self.line = line
+        self.marker = line.get_marker()  # Markers are only drawn while every point is shown
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.size = 0
+        line.axes.callbacks.connect("xlim_changed", self.on_xlim_changed)
+
+    def __len__(self):
+        return self.size
+
+    # Method to replace all points
+    def set_data(self, x, y):
+        self.x = np.array(x, dtype=np.float64)
+        self.y = np.array(y, dtype=np.float64)
+        self.size = len(self.x)
+        self.sort_points(0)
+        self.refresh()
+
+    # Method to append points. The buffers grow by doubling, so appends take amortized O(new points).
+    def extend(self, x, y):
+        count = len(x)
+        if self.size + count > len(self.x):
+            capacity = max(2 * len(self.x), self.size + count, 64)
+            for name in ("x", "y"):
+                grown = np.empty(capacity)
+                grown[:self.size] = getattr(self, name)[:self.size]
+                setattr(self, name, grown)
+        self.x[self.size:self.size + count] = x
+        self.y[self.size:self.size + count] = y
+        self.size += count
+        self.sort_points(self.size - count)
+
+    # Method to restore x order after the points from position first on were added. Points added
+    # in order cost one comparison per point.
+    def sort_points(self, first):
+        x = self.x[max(first - 1, 0):self.size]
+        if len(x) < 2 or not np.any(x[1:] < x[:-1]):
+            return
+        order = np.argsort(self.x[:self.size], kind="stable")
+        self.x[:self.size] = self.x[:self.size][order]
+        self.y[:self.size] = self.y[:self.size][order]
+
+    # Method to hand matplotlib the downsampled points of the visible x range (plus one point on
+    # either side, so lines run on to the edges)
+    def refresh(self):
+        x = self.x[:self.size]
+        y = self.y[:self.size]
+        ax = self.line.axes
+        left, right = sorted(ax.get_xlim())
+        first = max(int(np.searchsorted(x, left, "left")) - 1, 0)
+        stop = min(int(np.searchsorted(x, right, "right")) + 1, self.size)
+
+        indices = first + minmax_indices(y[first:stop], max(int(ax.bbox.width), 1))
+        self.line.set_data(x[indices], y[indices])
+        self.line.set_marker(self.marker if len(indices) == stop - first else "")
+
+    def on_xlim_changed(self, ax):
+        self.refresh()
+
+
+# Define a class for the four dashboard charts, updated incrementally as transactions are added.
+# Once the history grows past RAW_POINTS_LIMIT the time series charts switch to daily, weekly or
+# monthly totals read from the account's rollups.
+class DashboardCharts:
+    def __init__(self, figure, ax, account):
+        self.figure = figure
+        self.ax = ax
+        self.account = account
+
+        # Line artists are created once; updates only feed new points into them
+        self.spending_pattern_line, = ax[0, 0].plot([], [], marker='o', color='blue', linestyle='-', linewidth=2)
+        self.deposit_line, = ax[0, 1].plot([], [], marker='o', color='green', linestyle='-', linewidth=2)
+        self.spending_line, = ax[1, 0].plot([], [], marker='o', color='red', linestyle='-', linewidth=2)
+        self.stats_line, = ax[1, 1].plot([], [], marker='o', color='purple', linestyle='-', linewidth=2)
+
+        # Titles and axis labels never change, so they are set up once as well
+        labels = [
+            (ax[0, 0], 'Spending Pattern', 'Categories', 'Total Spending (IDR)'),
+            (ax[0, 1], 'Deposit History', 'Timestamp', 'Deposit Amount (IDR)'),
+            (ax[1, 0], 'Spending History', 'Timestamp', 'Spending Amount (IDR)'),
+            (ax[1, 1], 'Transaction Statistics', 'Timestamp', 'Transaction Amount (IDR)'),
+        ]
+        self.titles = {}
+        for chart_ax, title, xlabel, ylabel in labels:
+            self.titles[chart_ax] = title
+            chart_ax.set_title(title)
+            chart_ax.set_xlabel(xlabel)
+            chart_ax.set_ylabel(ylabel)
+            chart_ax.title.set_bbox(dict(boxstyle="round,pad=0.3", edgecolor="black", facecolor="w"))
+            chart_ax.tick_params(axis='x', which='both', bottom=False, top=False, labelbottom=True, labelrotation=45)
+
+        # Every time series line plots its points at their dates
+        self.series = {}
+        for line in (self.deposit_line, self.spending_line, self.stats_line):
+            self.series[line] = DownsampledLine(line)
+            use_date_axis(line.axes)
+        self.plotted_count = 0  # Ledger entries plotted so far
+        self.resolution = None  # Rollup resolution of the time series charts, None while plotting transactions
+
+        # Blitting needs a completed full draw to paint on top of
+        self.drawn = False
+        self.draw_connection = self.figure.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        self.drawn = True
+
+    # Method to detach from the figure, so the figure can be cleared and reused for other charts
+    def close(self):
+        self.figure.canvas.mpl_disconnect(self.draw_connection)
+
+    # Method to restyle the figure with a theme from CHART_THEMES. Only colors of existing artists
+    # change and no data is touched, so this costs the same for any length of history.
+    def apply_theme(self, name):
+        theme = CHART_THEMES[name]
+        self.figure.set_facecolor(theme["figure"])
+        for ax in self.ax.flat:
+            ax.set_facecolor(theme["axes"])
+            ax.tick_params(axis='both', which='both', colors=theme["text"])
+            ax.title.set_color(theme["text"])
+            ax.title.get_bbox_patch().set(facecolor=theme["title_box"], edgecolor=theme["edges"])
+            ax.xaxis.label.set_color(theme["text"])
+            ax.yaxis.label.set_color(theme["text"])
+            for spine in ax.spines.values():
+                spine.set_edgecolor(theme["edges"])
+        # The blitting background still has the old colors until the next full draw
+        self.drawn = False
+
+    # Method to add the transactions recorded since the last update.
+    # Returns (axes, limits_changed) for every axes whose contents changed.
+    def update(self):
+        history = self.account.get_transaction_history()
+        start = self.plotted_count
+        count = len(history)
+        if count == start:
+            return []
+
+        if self.resolution is not None or count > RAW_POINTS_LIMIT:
+            self.plotted_count = count
+            return [self.update_spending_pattern_chart()] + self.update_rollup_charts()
+
+        new_amounts = np.array(history.amounts[start:count], dtype=np.int64) / MINOR_UNITS
+        new_dates = np.array(history.timestamps[start:count], dtype=np.int64)
+        self.plotted_count = count
+
+        changes = [self.update_spending_pattern_chart()]
+        changes.append(self.update_deposit_chart(new_dates, new_amounts))
+        changes.append(self.update_spending_chart(new_dates, new_amounts))
+        changes.append(self.update_stats_chart(new_dates, new_amounts))
+        return [change for change in changes if change is not None]
+
+    # Methods to "update" each specific charts
+    def update_spending_pattern_chart(self):
+        # Category totals are maintained by the account, so this does not walk the history
+        category_totals = self.account.get_category_totals()
+        categories = list(category_totals)
+        spending = [total / MINOR_UNITS for total in category_totals.values()]
+
+        ax = self.spending_pattern_line.axes
+        limits = ax.viewLim.frozen()
+        ax.xaxis.update_units(categories)
+        self.spending_pattern_line.set_data(categories, spending)
+        ax.relim()
+        ax.autoscale_view(scaley=False)
+        self.grow_limits(ax, scalex=False)
+        return ax, ax.viewLim.bounds != limits.bounds
+
+    def update_deposit_chart(self, new_dates, new_amounts):
+        deposits = new_amounts > 0
+        return self.append_points(self.deposit_line, new_dates[deposits], new_amounts[deposits])
+
+    def update_spending_chart(self, new_dates, new_amounts):
+        spendings = new_amounts < 0
+        return self.append_points(self.spending_line, new_dates[spendings], -new_amounts[spendings])
+
+    def update_stats_chart(self, new_dates, new_amounts):
+        return self.append_points(self.stats_line, new_dates, new_amounts)
+
+    # Method to append new points to a line and grow its axes limits to fit them
+    def append_points(self, line, new_dates, new_values):
+        if not len(new_dates):
+            return None
+
+        series = self.series[line]
+        dates = date_numbers(new_dates)
+        series.extend(dates, new_values)
+
+        ax = line.axes
+        limits = ax.viewLim.frozen()
+        ax.update_datalim(np.column_stack((dates, new_values)))
+        self.grow_limits(ax)
+        if (ax.viewLim.x0, ax.viewLim.x1) == (limits.x0, limits.x1):
+            series.refresh()  # Otherwise the x limits callback already refreshed it
+        return ax, ax.viewLim.bounds != limits.bounds
+
+    # Method to replot the time series charts from the account's rollups
+    def update_rollup_charts(self):
+        starts = self.account.get_rollup("day")[0]
+        span = starts[-1] - starts[0]
+        resolution = next(name for name, longest in ROLLUP_SPANS if longest is None or span <= longest)
+        if resolution != self.resolution:
+            self.resolution = resolution
+            for line in self.series:
+                line.axes.title.set_text(f"{self.titles[line.axes]} (per {resolution})")
+
+        starts, credits, debits, counts = self.account.get_rollup(resolution)
+        starts = np.array(starts, dtype=np.int64)
+        credits = np.array(credits, dtype=np.int64) / MINOR_UNITS
+        debits = np.array(debits, dtype=np.int64) / MINOR_UNITS
+        return [
+            self.replace_points(self.deposit_line, starts, credits),
+            self.replace_points(self.spending_line, starts, -debits),
+            self.replace_points(self.stats_line, starts, credits + debits),
+        ]
+
+    # Method to replace all points of a line and fit its axes limits to them
+    def replace_points(self, line, dates, values):
+        dates = date_numbers(dates)
+
+        ax = line.axes
+        limits = ax.viewLim.frozen()
+        ax.ignore_existing_data_limits = True
+        ax.update_datalim(np.column_stack((dates, values)))
+        self.grow_limits(ax)
+        self.series[line].set_data(dates, values)
+        return ax, ax.viewLim.bounds != limits.bounds
+
+    # Method to fit the view limits of an axes to its data limits. The limits are left alone while the
+    # data stays inside them. Otherwise they grow to leave LIMIT_HEADROOM of the data range free past
+    # the data: on the right for dates, since live taps are always the newest, and on both sides for
+    # amounts. The next taps then usually fit, and draw can blit the axes instead of redrawing.
+    def grow_limits(self, ax, scalex=True):
+        data = ax.dataLim
+        view = ax.viewLim
+        if scalex and (data.x0 < view.x0 or data.x1 > view.x1):
+            span = max(data.x1 - data.x0, 1)  # Date numbers count days
+            ax.set_xlim(data.x0 - 0.02 * span, data.x1 + LIMIT_HEADROOM * span)
+        if data.y0 < view.y0 or data.y1 > view.y1:
+            span = max(data.y1 - data.y0, abs(data.y0), abs(data.y1), 1)
+            ax.set_ylim(data.y0 - LIMIT_HEADROOM * span, data.y1 + LIMIT_HEADROOM * span)
+
+    # Method to show the changed axes. Axes whose limits stayed put are blitted, anything else
+    # schedules one idle redraw of the whole figure.
+    def draw(self, changes):
+        if not changes:
+            return
+
+        canvas = self.figure.canvas
+        if self.drawn and canvas.supports_blit and not any(limits_changed for ax, limits_changed in changes):
+            for ax, limits_changed in changes:
+                ax.redraw_in_frame()
+                canvas.blit(ax.bbox)
+            if metrics is not None:
+                metrics.increment("DashboardCharts.blitted_draws")
+        else:
+            canvas.draw_idle()
+            if metrics is not None:
+                metrics.increment("DashboardCharts.full_redraws")
@@ -0,0 +1,672 @@
+# Headless core of the Flazz card application: transactions, the account ledger and the bank.
+# Nothing here imports GUI, plotting or export libraries, so batch jobs and services can use
+# it without paying for them. Persistence (FlazzStorage) is only imported when a bank is given
+# a data directory.
+from array import array
+from bisect import bisect_left, bisect_right
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from itertools import accumulate, islice
+import calendar
+import operator
+import sys
+import threading
+import time
+
+# Directory where the bank keeps its snapshot and transaction journal
+DATA_DIR = "flazz_data"
+
+# Format used for transaction timestamps shown to the user
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Helper functions for timestamps. Timestamps are stored as whole seconds of local wall-clock time
+# counted from 1970-01-01 00:00:00 (no timezone), so they convert to and from the display format exactly.
+def current_timestamp():
+    return calendar.timegm(time.localtime())
+
+def format_timestamp(epoch):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(epoch))
+
+def parse_timestamp(text):
+    return calendar.timegm(time.strptime(text, TIMESTAMP_FORMAT))
+
+# Helper function to accept a timestamp as seconds or as a display string (None stays None)
+def timestamp_seconds(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return parse_timestamp(value)
+    return int(value)
+
+# Money is kept as whole minor units (sen, 1/100 rupiah) in ints and int64 arrays, so sums and
+# balances are exact. Amounts are only converted at the edges: parse_amount for user input and
+# Transaction.format_currency for display.
+MINOR_UNITS = 100
+# Amounts and balances are stored in int64 arrays and snapshot fields, so they must stay below this
+AMOUNT_LIMIT = 2 ** 63
+
+# Helper function to convert an amount in rupiah (a number or text such as "12,500.50") to minor units.
+# Raises ValueError for amounts that are not numbers, have more than two decimal places or do not fit int64.
+def parse_amount(value):
+    if isinstance(value, bool):
+        raise ValueError(f"not an amount: {value!r}")
+    if isinstance(value, int):
+        amount = value * MINOR_UNITS
+    else:
+        try:
+            amount = Decimal(value.replace(",", "").strip() if isinstance(value, str) else str(value)) * MINOR_UNITS
+        except InvalidOperation:
+            raise ValueError(f"not an amount: {value!r}") from None
+        if not amount.is_finite() or amount != amount.to_integral_value():
+            raise ValueError(f"not an amount in whole sen: {value!r}")
+        amount = int(amount)
+    if abs(amount) >= AMOUNT_LIMIT:
+        raise ValueError(f"amount out of range: {value!r}")
+    return amount
+
+# Helper function to format an amount in minor units as exact rupiah text such as "12500.50",
+# which parse_amount reads back unchanged
+def format_amount(amount):
+    rupiah, sen = divmod(abs(amount), MINOR_UNITS)
+    return f"{'-' if amount < 0 else ''}{rupiah}.{sen:02d}"
+
+# Resolutions of the rollups kept by every ledger (see TransactionLedger.rollup)
+ROLLUP_RESOLUTIONS = ("day", "week", "month")
+DAY = 86400
+
+# Helper functions for the start of the week (Monday) and month containing a day's start timestamp
+def week_start(day):
+    # 1970-01-01 was a Thursday, three days after a Monday
+    return ((day // DAY + 3) // 7 * 7 - 3) * DAY
+
+@lru_cache(maxsize=4096)
+def month_start(day):
+    year, month = time.gmtime(day)[:2]
+    return calendar.timegm((year, month, 1, 0, 0, 0))
+
+# Define a class to represent individual transactions
+class Transaction:
+    __slots__ = ("amount", "timestamp", "category")
+
+    def __init__(self, amount, timestamp, category):
+        # Initialize transaction attributes
+        self.amount = amount  # Transaction amount in minor units (positive for deposits, negative for withdrawals)
+        self.timestamp = timestamp  # Timestamp when the transaction occurred
+        self.category = category  # Category of the transaction (e.g., "Toll Road", "Supermarket")
+
+    def __str__(self):
+        # String representation of the transaction for display purposes
+        return f"{self.category}: {self.format_currency(self.amount)} IDR at {self.timestamp}"
+
+    @staticmethod
+    def format_currency(amount):
+        # Helper method to format an amount in minor units as rupiah with commas and two decimal places
+        rupiah, sen = divmod(abs(int(amount)), MINOR_UNITS)
+        return f"{'-' if amount < 0 else ''}{rupiah:,}.{sen:02d}"
+
+# Define a class to store the transaction history of an account in compact typed arrays
+class TransactionLedger:
+    def __init__(self):
+        # One entry per transaction in each column array
+        self.amounts = array("q")  # Transaction amounts in minor units
+        self.timestamps = array("q")  # Timestamps as seconds (see current_timestamp)
+        self.category_codes = array("H")  # Index into self.categories
+
+        # Interned category names (code: category) and the reverse lookup (category: code)
+        self.categories = []
+        self.category_lookup = {}
+
+        # Running totals and transaction counts per category code, kept up to date on every append
+        self.category_totals = []
+        self.category_counts = []
+
+        self.reset_time_index()
+        self.reset_rollups()
+
+    # Method to forget the rollups; they are rebuilt on the next rollup query
+    def reset_rollups(self):
+        # Per resolution, a dict of bucket start timestamp: {category code: [credits, debits, count]}.
+        # Credits sum the positive amounts and debits the negative ones.
+        self.rollups = {resolution: {} for resolution in ROLLUP_RESOLUTIONS}
+        self.rolled_count = 0  # Ledger entries added to the rollups
+
+    # Method to add one entry to the rollups
+    def add_to_rollups(self, amount, timestamp, code):
+        day = timestamp - timestamp % DAY
+        for resolution, start in (("day", day), ("week", week_start(day)), ("month", month_start(day))):
+            buckets = self.rollups[resolution]
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = {}
+            totals = bucket.get(code)
+            if totals is None:
+                totals = bucket[code] = [0, 0, 0]
+            totals[0 if amount > 0 else 1] += amount
+            totals[2] += 1
+
+    # Method to add the entries recorded in bulk (extend, restore) to the rollups
+    def update_rollups(self):
+        count = len(self.amounts)
+        if self.rolled_count == count:
+            return
+        add = self.add_to_rollups
+        for amount, timestamp, code in zip(self.amounts[self.rolled_count:count], self.timestamps[self.rolled_count:count],
+                                           self.category_codes[self.rolled_count:count]):
+            add(amount, timestamp, code)
+        self.rolled_count = count
+
+    # Method to get the rollup series of a resolution as lists (bucket starts, credits, debits, counts),
+    # oldest bucket first. Only the given categories are summed if categories is not None.
+    def rollup(self, resolution, categories=None):
+        self.update_rollups()
+        codes = None
+        if categories is not None:
+            codes = {self.category_lookup[category] for category in categories if category in self.category_lookup}
+
+        starts, credits, debits, counts = [], [], [], []
+        buckets = self.rollups[resolution]
+        for start in sorted(buckets):
+            credit = debit = count = 0
+            for code, totals in buckets[start].items():
+                if codes is None or code in codes:
+                    credit += totals[0]
+                    debit += totals[1]
+                    count += totals[2]
+            if count:
+                starts.append(start)
+                credits.append(credit)
+                debits.append(debit)
+                counts.append(count)
+        return starts, credits, debits, counts
+
+    # Method to forget the time index; it is rebuilt on the next time query
+    def reset_time_index(self):
+        # The time index lists the entries sorted by timestamp (ties keep ledger order) together with
+        # running sums of their amounts, so time windows and past balances take a binary search.
+        # While timestamps never go backwards the ledger order is the time order, and only the
+        # running sums are kept.
+        self.indexed_count = 0  # Ledger entries covered by the time index
+        self.time_order = None  # Ledger indices in time order, or None while that is the ledger order
+        self.sorted_timestamps = None  # Timestamps in time order, or None while self.timestamps is sorted
+        self.time_sums = array("q")  # time_sums[i]: sum of the amounts of the first i + 1 entries in time order
+
+    # Method to bring the time index up to date. Entries recorded in time order extend it; an
+    # entry older than the newest indexed one makes it sort the whole ledger again.
+    def update_time_index(self):
+        count = len(self.timestamps)
+        indexed = self.indexed_count
+        if indexed == count:
+            return
+
+        timestamps = self.timestamps
+        new_timestamps = timestamps[indexed:count]
+        sorted_timestamps = timestamps if self.sorted_timestamps is None else self.sorted_timestamps
+        latest = sorted_timestamps[indexed - 1] if indexed else new_timestamps[0]
+        in_order = latest <= new_timestamps[0] and all(a <= b for a, b in zip(new_timestamps, new_timestamps[1:]))
+
+        if in_order:
+            total = self.time_sums[-1] if indexed else 0
+            self.time_sums.extend(islice(accumulate(self.amounts[indexed:count], initial=total), 1, None))
+            if self.time_order is not None:
+                self.time_order.extend(range(indexed, count))
+                self.sorted_timestamps.extend(new_timestamps)
+        else:
+            amounts = self.amounts
+            order = array("q", sorted(range(count), key=timestamps.__getitem__))
+            self.time_order = order
+            self.sorted_timestamps = array("q", map(timestamps.__getitem__, order))
+            self.time_sums = array("q", accumulate(map(amounts.__getitem__, order)))
+        self.indexed_count = count
+
+    # Method to find the position in time order of the first entry after the given timestamp
+    # (after=True) or at or after it (after=False)
+    def time_position(self, timestamp, after=False):
+        self.update_time_index()
+        timestamps = self.timestamps if self.sorted_timestamps is None else self.sorted_timestamps
+        search = bisect_right if after else bisect_left
+        return search(timestamps, timestamp, 0, self.indexed_count)
+
+    # Method to get the (first, stop) positions in time order of the entries with start <= timestamp < end.
+    # Either end may be None for an open window.
+    def time_window(self, start=None, end=None):
+        start = timestamp_seconds(start)
+        end = timestamp_seconds(end)
+        first = 0 if start is None else self.time_position(start)
+        if end is None:
+            self.update_time_index()
+            stop = self.indexed_count
+        else:
+            stop = self.time_position(end)
+        return first, max(first, stop)
+
+    # Method to get the ledger indices of the entries at positions first to stop in time order
+    def time_indices(self, first, stop):
+        self.update_time_index()
+        if self.time_order is None:
+            return range(first, stop)
+        return self.time_order[first:stop]
+
+    # Method to get the total amount of the entries before a position in time order
+    def amount_before(self, position):
+        self.update_time_index()
+        return self.time_sums[position - 1] if position > 0 else 0
+
+    # Method to get the code of a category, registering it on first use
+    def category_code(self, category):
+        code = self.category_lookup.get(category)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(category)
+            self.category_lookup[category] = code
+            self.category_totals.append(0)
+            self.category_counts.append(0)
+        return code
+
+    # Method to record a transaction
+    def append(self, amount, timestamp, category):
+        code = self.category_code(category)
+        self.amounts.append(amount)
+        self.timestamps.append(timestamp)
+        self.category_codes.append(code)
+        self.category_totals[code] += amount
+        self.category_counts[code] += 1
+        if self.rolled_count == len(self.amounts) - 1:  # Unless bulk entries still wait to be rolled up
+            self.add_to_rollups(amount, timestamp, code)
+            self.rolled_count += 1
+
+    # Method to record many transactions at once. The columns are arrays (or bytes) of the same
+    # types as the ledger columns, and category_codes index into the given list of categories.
+    def extend(self, amounts, timestamps, category_codes, categories):
+        amounts = array(self.amounts.typecode, amounts)
+        timestamps = array(self.timestamps.typecode, timestamps)
+        category_codes = array(self.category_codes.typecode, category_codes)
+        if not len(amounts) == len(timestamps) == len(category_codes):
+            raise ValueError("Transaction columns must have the same length")
+
+        ledger_codes = [self.category_code(category) for category in categories]
+        if ledger_codes != list(range(len(ledger_codes))):
+            category_codes = array(self.category_codes.typecode, map(ledger_codes.__getitem__, category_codes))
+
+        totals = self.category_totals
+        counts = self.category_counts
+        for amount, code in zip(amounts, category_codes):
+            totals[code] += amount
+            counts[code] += 1
+
+        self.amounts.extend(amounts)
+        self.timestamps.extend(timestamps)
+        self.category_codes.extend(category_codes)
+        return amounts, timestamps, category_codes
+
+    # Method to replace the contents of the ledger with saved columns
+    def restore(self, amounts, timestamps, category_codes, categories, category_totals, category_counts):
+        self.amounts = amounts
+        self.timestamps = timestamps
+        self.category_codes = category_codes
+        self.categories = list(categories)
+        self.category_lookup = {category: code for code, category in enumerate(self.categories)}
+        self.category_totals = list(category_totals)
+        self.category_counts = list(category_counts)
+        self.reset_time_index()
+        self.reset_rollups()
+
+    # Method to build the Transaction object for a single entry
+    def transaction_at(self, index):
+        return Transaction(self.amounts[index], format_timestamp(self.timestamps[index]), self.categories[self.category_codes[index]])
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __getitem__(self, index):
+        # Transaction objects are only created when asked for
+        if isinstance(index, slice):
+            return [self.transaction_at(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+        return self.transaction_at(index)
+
+    def __iter__(self):
+        categories = self.categories
+        for amount, timestamp, code in zip(self.amounts, self.timestamps, self.category_codes):
+            yield Transaction(amount, format_timestamp(timestamp), categories[code])
+
+    # Method to get the timestamps of the selected entries as display strings
+    def timestamp_strings(self, indices=None):
+        timestamps = self.timestamps
+        if indices is None:
+            return [format_timestamp(timestamp) for timestamp in timestamps]
+        return [format_timestamp(timestamps[i]) for i in indices]
+
+# Shared, always empty ledger of accounts that have no transactions yet. It is only ever read;
+# accounts get a ledger of their own on their first transaction (see Account.writable_ledger).
+EMPTY_LEDGER = TransactionLedger()
+
+# Transaction categories. Deposits are positive, spending is negative and transfers can be either.
+SPENDING_CATEGORIES = ["Toll Road", "Public Transportation", "Supermarket", "Gas Station", "Recreational", "Other"]
+CATEGORIES = ["Deposit", "Transfer"] + SPENDING_CATEGORIES
+
+# Locks of the accounts. Accounts share a fixed set of reentrant locks, each using the one its
+# number hashes to, so millions of accounts do not need a lock object each. Code that locks
+# several accounts acquires their locks in index order (see Account.lock_index).
+LOCK_STRIPES = 1024
+ACCOUNT_LOCKS = [threading.RLock() for _ in range(LOCK_STRIPES)]
+
+# Helper function to acquire the locks of a set of accounts, in lock index order so that
+# concurrent transfers cannot deadlock. Returns the acquired locks for release_locks.
+def acquire_locks(accounts):
+    locks = [ACCOUNT_LOCKS[index] for index in sorted({account.lock_index for account in accounts})]
+    for position, lock in enumerate(locks):
+        try:
+            lock.acquire()
+        except BaseException:
+            release_locks(locks[:position])
+            raise
+    return locks
+
+def release_locks(locks):
+    for lock in reversed(locks):
+        lock.release()
+
+# Helper function to get the registry key of an account number: 10-digit numbers are stored as
+# ints (they fit in 64 bits), anything else as the string itself
+def account_key(account_number):
+    if isinstance(account_number, int):
+        return account_number
+    if len(account_number) == 10 and account_number.isascii() and account_number.isdigit():
+        return int(account_number)
+    return account_number
+
+# Define a class to represent a bank account. Accounts are slotted and allocate their ledger
+# on the first transaction, so registered but unused cards stay small.
+class Account:
+    __slots__ = ("key", "account_holder", "balance", "opening_balance", "ledger", "journal")
+
+    def __init__(self, account_number, account_holder, balance):
+        # Initialize account attributes
+        self.key = account_key(account_number)  # Unique identifier for the account (see account_key)
+        self.account_holder = sys.intern(account_holder)  # Full name of the account holder; repeated names are shared
+        self.balance = operator.index(balance)  # Current balance in the account, in minor units
+        self.opening_balance = self.balance  # Balance the account was created with
+        self.ledger = None  # Ledger to store transaction history, created on the first transaction
+        self.journal = None  # Bank storage that records every change, if the bank is persistent
+
+    @property
+    def account_number(self):
+        key = self.key
+        return f"{key:010d}" if isinstance(key, int) else key
+
+    @property
+    def transactions(self):
+        # The transaction history (read only; EMPTY_LEDGER until the first transaction)
+        return EMPTY_LEDGER if self.ledger is None else self.ledger
+
+    def writable_ledger(self):
+        # Get the ledger of the account for recording, creating it if needed. The caller holds self.lock.
+        if self.ledger is None:
+            self.ledger = TransactionLedger()
+        return self.ledger
+
+    @property
+    def lock_index(self):
+        return hash(self.key) % LOCK_STRIPES
+
+    @property
+    def lock(self):
+        # Held while the balance and ledger change
+        return ACCOUNT_LOCKS[hash(self.key) % LOCK_STRIPES]
+
+    def deposit(self, amount, category, timestamp=None):
+        # Deposit funds (an int amount in minor units) into the account, at the current time unless a timestamp is given
+        if amount <= 0:
+            raise ValueError(f"deposit amount must be positive: {amount!r}")
+        self.record(amount, current_timestamp() if timestamp is None else timestamp, category)
+
+    def withdraw(self, amount, category, timestamp=None):
+        # Withdraw funds from the account if there are sufficient funds.
+        # Returns False (and changes nothing) when the balance is too low.
+        if amount <= 0:
+            raise ValueError(f"withdrawal amount must be positive: {amount!r}")
+        with self.lock:
+            if amount <= self.balance:
+                self.record(-amount, current_timestamp() if timestamp is None else timestamp, category)
+                return True
+            return False
+
+    def apply(self, amount, timestamp, category):
+        # Apply a transaction to the balance and the ledger without journaling it.
+        # The caller holds self.lock. Returns the ledger index of the transaction.
+        # Amounts must be ints (minor units); the ledger append rejects anything else before the balance changes
+        amount = operator.index(amount)
+        if abs(self.balance + amount) >= AMOUNT_LIMIT:
+            raise ValueError(f"balance out of range: {self.balance} + {amount}")
+        ledger = self.writable_ledger()
+        position = len(ledger)
+        ledger.append(amount, timestamp, category)
+        self.balance += amount
+        return position
+
+    def record(self, amount, timestamp, category):
+        # Apply a transaction to the balance and the ledger, and journal it
+        with self.lock:
+            index = self.apply(amount, timestamp, category)
+            if self.journal is not None:
+                self.journal.record_transaction(self.account_number, index, amount, timestamp, category)
+
+    def record_batch(self, amounts, timestamps, category_codes, categories):
+        # Apply many transactions at once (see TransactionLedger.extend) and journal them as one record
+        with self.lock:
+            ledger = self.writable_ledger()
+            index = len(ledger)
+            amounts = array(ledger.amounts.typecode, amounts)
+            balance = self.balance + sum(amounts)
+            if abs(balance) >= AMOUNT_LIMIT:
+                raise ValueError(f"balance out of range: {self.balance} + {len(amounts)} transactions")
+            amounts, timestamps, category_codes = ledger.extend(amounts, timestamps, category_codes, categories)
+            self.balance = balance
+            if self.journal is not None:
+                self.journal.record_batch(self.account_number, index, amounts, timestamps, category_codes, ledger.categories)
+
+    def get_balance(self):
+        # Get the current balance of the account
+        return self.balance
+
+    def get_transaction_history(self):
+        # Get the transaction history of the account
+        return self.transactions
+
+    def history_between(self, start=None, end=None):
+        # Get the transactions with start <= timestamp < end, oldest first. Timestamps may be
+        # seconds or display strings, and either end may be None.
+        with self.lock:
+            ledger = self.transactions
+            first, stop = ledger.time_window(start, end)
+            return [ledger.transaction_at(index) for index in ledger.time_indices(first, stop)]
+
+    def last_n(self, n):
+        # Get the n most recent transactions, oldest first
+        with self.lock:
+            ledger = self.transactions
+            count = len(ledger)
+            return [ledger.transaction_at(index) for index in ledger.time_indices(max(count - n, 0), count)]
+
+    def balance_at(self, timestamp):
+        # Get the balance right after the last transaction at or before the timestamp
+        with self.lock:
+            ledger = self.transactions
+            position = ledger.time_position(timestamp_seconds(timestamp), after=True)
+            return self.opening_balance + ledger.amount_before(position)
+
+    def get_rollup(self, resolution, categories=None):
+        # Get the (bucket starts, credits, debits, counts) series of a resolution from ROLLUP_RESOLUTIONS
+        with self.lock:
+            return self.transactions.rollup(resolution, categories)
+
+    def get_category_totals(self):
+        # Get the total amount per category, in the order the categories were first used
+        return dict(zip(self.transactions.categories, self.transactions.category_totals))
+
+    def get_category_counts(self):
+        # Get the number of transactions per category, in the order the categories were first used
+        return dict(zip(self.transactions.categories, self.transactions.category_counts))
+
+# Define a class for the accounts of a bank: a dictionary keyed by account_key, so that account
+# numbers are stored as small ints rather than strings. Lookups take account numbers as strings
+# (or ints) and iteration yields them as strings, like a plain dictionary of accounts would.
+class AccountRegistry:
+    def __init__(self):
+        self.by_key = {}  # account_key(account_number): Account
+
+    def add(self, account):
+        self.by_key[account.key] = account
+
+    def get(self, account_number, default=None):
+        return self.by_key.get(account_key(account_number), default)
+
+    def __getitem__(self, account_number):
+        return self.by_key[account_key(account_number)]
+
+    def __contains__(self, account_number):
+        return account_key(account_number) in self.by_key
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def __iter__(self):
+        return (account.account_number for account in self.by_key.values())
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return self.by_key.values()
+
+    def items(self):
+        return ((account.account_number, account) for account in self.by_key.values())
+
+# Define a class to represent a bank
+class Bank:
+    def __init__(self, bank_name, data_dir=None):
+        # Initialize bank attributes
+        self.bank_name = bank_name  # Name of the bank
+        self.accounts = AccountRegistry()  # Accounts by account number
+        self.accounts_lock = threading.Lock()  # Guards adding accounts; transfers only lock their two accounts
+        self.storage = None  # BankStorage when the bank is persisted to a data directory
+        if data_dir is not None:
+            self.open_storage(data_dir)
+
+    def open_storage(self, data_dir, **options):
+        # Load the accounts saved in the data directory and journal all further changes to it
+        from FlazzStorage import BankStorage, AccountRecord, BatchRecord, TransferRecord
+
+        storage = BankStorage(data_dir, **options)
+
+        for saved in storage.read_snapshot():
+            account = Account(saved.account_number, saved.account_holder, saved.opening_balance)
+            account.balance = saved.balance
+            if len(saved.amounts) or saved.categories:
+                account.writable_ledger().restore(saved.amounts, saved.timestamps, saved.category_codes,
+                                                  saved.categories, saved.category_totals, saved.category_counts)
+            self.accounts.add(account)
+
+        for record in storage.replay():
+            if isinstance(record, AccountRecord):
+                if record.account_number not in self.accounts:
+                    self.accounts.add(Account(record.account_number, record.account_holder, record.opening_balance))
+                continue
+            if isinstance(record, TransferRecord):
+                # Each leg is applied unless the snapshot already holds it
+                for number, index, amount in ((record.from_account, record.from_index, -record.amount),
+                                              (record.to_account, record.to_index, record.amount)):
+                    account = self.accounts[number]
+                    if index == len(account.transactions):
+                        account.apply(amount, record.timestamp, "Transfer")
+                continue
+            account = self.accounts[record.account_number]
+            if record.index == len(account.transactions):
+                if isinstance(record, BatchRecord):
+                    account.record_batch(record.amounts, record.timestamps, record.category_codes, record.categories)
+                else:
+                    account.record(record.amount, record.timestamp, record.category)
+            elif record.index > len(account.transactions):
+                raise ValueError(f"Journal for account {record.account_number} is missing transactions before #{record.index}")
+
+        storage.attach(self)
+        for account in self.accounts.values():
+            account.journal = storage
+        self.storage = storage
+
+    def close(self):
+        # Write a final snapshot and close the journal of a persistent bank
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
+            for account in self.accounts.values():
+                account.journal = None
+
+    def report(self, start=None, end=None, **options):
+        # Build a report of totals by category, top spenders and balances across all accounts
+        # (see FlazzBankAnalytics.bank_report)
+        from FlazzBankAnalytics import bank_report
+        return bank_report(self, start, end, **options)
+
+    def create_account(self, account_number, account_holder, initial_balance):
+        # Create a new account if the account number is unique
+        with self.accounts_lock:
+            if account_number not in self.accounts:
+                account = Account(account_number, account_holder, initial_balance)
+                self.accounts.add(account)
+                if self.storage is not None:
+                    self.storage.record_account(account)
+                    account.journal = self.storage
+                return account
+        return None
+
+    def get_account(self, account_number):
+        # Get the account associated with a given account number
+        return self.accounts.get(account_number)
+
+    def transfer_funds(self, from_account, to_account, amount):
+        # Transfer funds from one account to another if there are sufficient funds.
+        # Both accounts are locked (see acquire_locks) and both legs are journaled as one record,
+        # so a transfer happens entirely or not at all.
+        source = self.accounts.get(from_account)
+        target = self.accounts.get(to_account)
+        if source is None or target is None or source is target:
+            return False
+
+        locks = acquire_locks((source, target))
+        try:
+            return self.apply_transfer(source, target, amount, current_timestamp())
+        finally:
+            release_locks(locks)
+
+    def transfer_many(self, transfers):
+        # Apply a list of (from_account, to_account, amount) transfers in order and return a list
+        # telling which of them succeeded. Each transfer locks only its own two accounts, so a
+        # large batch does not hold every stripe it touches while other threads wait on them.
+        timestamp = current_timestamp()
+        results = []
+        for from_account, to_account, amount in transfers:
+            source = self.accounts.get(from_account)
+            target = self.accounts.get(to_account)
+            if source is None or target is None or source is target:
+                results.append(False)
+                continue
+            locks = acquire_locks((source, target))
+            try:
+                results.append(self.apply_transfer(source, target, amount, timestamp))
+            finally:
+                release_locks(locks)
+        return results
+
+    def apply_transfer(self, source, target, amount, timestamp):
+        # Move the money between two accounts whose locks the caller holds
+        if amount <= 0 or source.balance < amount or target.balance + amount >= AMOUNT_LIMIT:
+            return False
+        from_index = source.apply(-amount, timestamp, "Transfer")
+        to_index = target.apply(amount, timestamp, "Transfer")
+        if self.storage is not None:
+            self.storage.record_transfer(source.account_number, from_index, target.account_number, to_index, amount, timestamp)
+        return True
@@ -0,0 +1,175 @@
+# Streaming export of an account's transaction history to Excel, CSV or Parquet.
+#
+# The ledger is read in fixed-size chunks, so memory use does not depend on the length of
+# the history. Each row carries the balance right after that transaction, computed with a
+# cumulative sum that continues from one chunk to the next. Amounts and balances are int64
+# minor units until they are written: as exact two-decimal text to CSV, as rupiah numbers shown
+# with two decimals to Excel, and as exact decimal(18, 2) values to Parquet.
+import csv
+import os
+
+import numpy as np
+
+from FlazzCore import MINOR_UNITS
+
+EXPORT_COLUMNS = ["Category", "Amount", "Timestamp", "Remaining Balance"]
+EXPORT_FORMATS = {".xlsx": "xlsx", ".csv": "csv", ".parquet": "parquet"}
+DEFAULT_CHUNK_SIZE = 65536
+EXCEL_MAX_ROWS = 1048576  # Rows per worksheet, including the header row
+EXCEL_MONEY_FORMAT = "0.00"
+
+
+# Helper function to copy the (amounts, timestamps, category codes) entries at the given ledger
+# indices into numpy arrays. A range is copied as slices; other index lists, such as a time
+# window, are gathered one by one.
+def gather_columns(ledger, indices):
+    if isinstance(indices, range) and indices.step == 1:
+        # Slicing copies the entries out of the ledger, so the account can keep recording meanwhile
+        return (np.frombuffer(ledger.amounts[indices.start:indices.stop], dtype=np.int64),
+                np.frombuffer(ledger.timestamps[indices.start:indices.stop], dtype=np.int64),
+                np.frombuffer(ledger.category_codes[indices.start:indices.stop], dtype=np.uint16))
+    return (np.fromiter(map(ledger.amounts.__getitem__, indices), dtype=np.int64, count=len(indices)),
+            np.fromiter(map(ledger.timestamps.__getitem__, indices), dtype=np.int64, count=len(indices)),
+            np.fromiter(map(ledger.category_codes.__getitem__, indices), dtype=np.uint16, count=len(indices)))
+
+# Helper function to read the history as chunks of (categories, amounts, timestamps, balances)
+# numpy arrays. The history is cut off at its length when the export starts. With a start or
+# end timestamp, or with time_order set, the transactions (only those with start <= timestamp < end)
+# are read in time order, and the balances continue from the balance just before the window.
+# Otherwise they are read in the order they were recorded.
+def iter_history_chunks(account, chunk_size=DEFAULT_CHUNK_SIZE, start=None, end=None, time_order=False):
+    ledger = account.get_transaction_history()
+    with account.lock:
+        if start is None and end is None and not time_order:
+            indices = range(len(ledger.category_codes))
+            balance = account.opening_balance
+        else:
+            first, stop = ledger.time_window(start, end)
+            indices = ledger.time_indices(first, stop)
+            balance = account.opening_balance + ledger.amount_before(first)
+        categories = np.array(ledger.categories[:], dtype=object)
+
+    for chunk_start in range(0, len(indices), chunk_size):
+        amounts, timestamps, codes = gather_columns(ledger, indices[chunk_start:chunk_start + chunk_size])
+        balances = np.cumsum(np.concatenate((np.array([balance], dtype=np.int64), amounts)))[1:]
+        balance = balances[-1]
+        yield categories[codes], amounts, timestamps, balances
+
+# Helper function to count the transactions an export of the window would write
+def history_size(account, start=None, end=None):
+    if start is None and end is None:
+        return len(account.get_transaction_history())
+    with account.lock:
+        first, stop = account.get_transaction_history().time_window(start, end)
+    return stop - first
+
+# Helper function to format second timestamps like FlazzCore.format_timestamp ("%Y-%m-%d %H:%M:%S"), for a whole array
+def format_timestamps(timestamps):
+    text = np.datetime_as_string(timestamps.astype("datetime64[s]"), unit="s")
+    return np.char.replace(text, "T", " ")
+
+# Helper function to convert minor units to rupiah numbers. Doubles hold every amount up to
+# about 90 trillion rupiah closely enough to print back with the same two decimals.
+def to_rupiah(values):
+    return (values / MINOR_UNITS).tolist()
+
+# Helper function to format minor units as rupiah text with exactly two decimals ("-1234.50"),
+# computed on the integers so no amount is rounded
+def format_rupiah(values):
+    values = values.astype(np.int64)
+    rupiah, sen = np.divmod(np.abs(values), MINOR_UNITS)
+    text = np.char.add(np.char.add(rupiah.astype(str), "."), np.char.zfill(sen.astype(str), 2))
+    return np.where(values < 0, np.char.add("-", text), text).tolist()
+
+# Helper function to build an exact decimal(18, 2) Arrow array from int64 minor units
+def decimal_array(values):
+    import pyarrow as pa
+
+    # decimal128 values are 16-byte little-endian two's complement integers: each int64 followed by its sign extension
+    values = values.astype(np.int64)
+    data = np.column_stack((values, values >> 63))
+    return pa.Array.from_buffers(pa.decimal128(18, 2), len(values), [None, pa.py_buffer(data.tobytes())])
+
+
+def write_csv(path, chunks):
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(EXPORT_COLUMNS)
+        for categories, amounts, timestamps, balances in chunks:
+            writer.writerows(zip(categories, format_rupiah(amounts), format_timestamps(timestamps).tolist(), format_rupiah(balances)))
+            yield len(amounts)
+
+def write_xlsx(path, chunks):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    # Write-only workbooks stream rows to disk instead of keeping every cell in memory
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = EXCEL_MAX_ROWS
+    for categories, amounts, timestamps, balances in chunks:
+        rows = zip(categories, to_rupiah(amounts), format_timestamps(timestamps).tolist(), to_rupiah(balances))
+        for category, amount, timestamp, balance in rows:
+            if sheet_rows == EXCEL_MAX_ROWS:
+                # Histories longer than one worksheet continue on the next one
+                sheet = workbook.create_sheet(f"Transactions {len(workbook.worksheets) + 1}" if workbook.worksheets else "Transactions")
+                sheet.append(EXPORT_COLUMNS)
+                sheet_rows = 1
+                # Money cells are numbers shown with two decimals. A write-only sheet writes each
+                # row out as it is appended, so the same two styled cells serve every row.
+                amount_cell = WriteOnlyCell(sheet)
+                amount_cell.number_format = EXCEL_MONEY_FORMAT
+                balance_cell = WriteOnlyCell(sheet)
+                balance_cell.number_format = EXCEL_MONEY_FORMAT
+            amount_cell.value = amount
+            balance_cell.value = balance
+            sheet.append((category, amount_cell, timestamp, balance_cell))
+            sheet_rows += 1
+        yield len(amounts)
+
+    if sheet is None:
+        workbook.create_sheet("Transactions").append(EXPORT_COLUMNS)
+    workbook.save(path)
+
+def write_parquet(path, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("Category", pa.string()),
+        ("Amount", pa.decimal128(18, 2)),
+        ("Timestamp", pa.timestamp("s")),
+        ("Remaining Balance", pa.decimal128(18, 2)),
+    ])
+    # Every chunk becomes one row group of the file
+    with pq.ParquetWriter(path, schema) as writer:
+        for categories, amounts, timestamps, balances in chunks:
+            table = pa.Table.from_arrays([
+                pa.array(categories, type=pa.string()),
+                decimal_array(amounts),
+                pa.array(timestamps.astype("datetime64[s]")),
+                decimal_array(balances),
+            ], schema=schema)
+            writer.write_table(table)
+            yield len(amounts)
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx, "parquet": write_parquet}
+
+
+# Method to export the transaction history of an account. The format is taken from the file
+# extension unless given. start and end limit the export to a time window (see iter_history_chunks).
+# progress(rows_written, total_rows) is called after every chunk. Returns the number of rows written.
+def export_transactions(account, path, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, start=None, end=None):
+    if file_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export file type {extension!r}")
+        file_format = EXPORT_FORMATS[extension]
+
+    total = history_size(account, start, end)
+    written = 0
+    for rows in WRITERS[file_format](path, iter_history_chunks(account, chunk_size, start, end)):
+        written += rows
+        if progress is not None:
+            progress(written, total)
+    return written
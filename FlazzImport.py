@@ -0,0 +1,171 @@
+# Bulk import of historical transactions from CSV or Excel files.
+#
+# Files use the same columns as the Excel export: Category, Amount (rupiah with at most two
+# decimal places, positive for deposits and negative for spending) and Timestamp
+# ("%Y-%m-%d %H:%M:%S"); other columns are ignored. Amounts are imported as minor units.
+# Rows are read in chunks, validated with vectorized pandas operations and applied to the
+# account one chunk at a time with their original timestamps.
+#
+# Usage: python FlazzImport.py FILE --account NUMBER [--data-dir DIR] [--chunk-size N] [--skip-invalid]
+import argparse
+import os
+import sys
+import time
+from array import array
+from itertools import accumulate
+
+import numpy as np
+import pandas as pd
+
+from FlazzCore import Bank, CATEGORIES, SPENDING_CATEGORIES, TIMESTAMP_FORMAT, DATA_DIR, MINOR_UNITS, AMOUNT_LIMIT
+
+IMPORT_COLUMNS = ["Category", "Amount", "Timestamp"]
+DEFAULT_CHUNK_SIZE = 100000
+# Amount text: sign, whole rupiah (at most 13 digits) and at most two decimal places that are not zero.
+# Below 10**13 rupiah the float value of such a text times MINOR_UNITS rounds to its exact minor units.
+AMOUNT_PATTERN = r"[+-]?\d{1,13}(?:\.\d{0,2}0*)?"
+
+
+# Helper function to read a CSV or XLSX file as DataFrame chunks of at most chunk_size rows
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        yield from pd.read_csv(path, usecols=IMPORT_COLUMNS, dtype="string", chunksize=chunk_size)
+    elif extension in (".xlsx", ".xlsm"):
+        yield from read_excel_chunks(path, chunk_size)
+    else:
+        raise ValueError(f"Unsupported file type {extension!r}; expected .csv or .xlsx")
+
+def read_excel_chunks(path, chunk_size):
+    from openpyxl import load_workbook
+
+    # Read-only mode streams the sheet instead of loading it whole
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name) if name is not None else "" for name in next(rows, ())]
+        missing = [name for name in IMPORT_COLUMNS if name not in header]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        positions = [header.index(name) for name in IMPORT_COLUMNS]
+
+        chunk = []
+        for row in rows:
+            chunk.append([row[position] if position < len(row) else None for position in positions])
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=IMPORT_COLUMNS)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=IMPORT_COLUMNS)
+    finally:
+        workbook.close()
+
+
+# Helper function to validate one chunk. Returns the amounts (int64 minor units), timestamps
+# (seconds, see FlazzCore.current_timestamp) and categories as a Categorical, plus a mask of valid rows.
+def validate_chunk(chunk):
+    categories = pd.Categorical(chunk["Category"].astype("string").str.strip(), categories=CATEGORIES)
+    timestamps = pd.to_datetime(chunk["Timestamp"], format=TIMESTAMP_FORMAT, errors="coerce")
+
+    # Amounts are checked on their text, so ones with more than two decimal places are invalid at
+    # any size; the rest round to exact minor units
+    text = chunk["Amount"].astype("string").str.strip()
+    valid = text.str.fullmatch(AMOUNT_PATTERN).to_numpy(dtype=bool, na_value=False)
+    rupiah = pd.to_numeric(text.where(valid), errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    amounts = np.where(valid, np.round(rupiah * MINOR_UNITS), 0).astype(np.int64)
+
+    valid &= (amounts != 0) & (categories.codes >= 0) & timestamps.notna().to_numpy()
+
+    # Deposits must add money and spending must take it away
+    is_deposit = np.asarray(categories == "Deposit")
+    is_spending = np.asarray(categories.isin(SPENDING_CATEGORIES))
+    valid &= ~(is_deposit & (amounts < 0)) & ~(is_spending & (amounts > 0))
+
+    seconds = timestamps.to_numpy(dtype="datetime64[s]", na_value=np.datetime64("NaT")).astype(np.int64)
+    return amounts, seconds, categories, valid
+
+
+# Method to import a transaction file into an account. Invalid rows raise a ValueError unless
+# skip_invalid is set, in which case they are counted and left out. Chunks applied before an
+# error stay applied. Returns (imported, rejected) row counts.
+def import_transactions(account, path, chunk_size=DEFAULT_CHUNK_SIZE, skip_invalid=False, progress=None):
+    imported = 0
+    rejected = 0
+    first_row = 0
+
+    for chunk in read_chunks(path, chunk_size):
+        amounts, timestamps, categories, valid = validate_chunk(chunk)
+
+        if not valid.all():
+            if not skip_invalid:
+                bad_rows = np.flatnonzero(~valid)[:5] + first_row + 2  # File line numbers (header is line 1)
+                raise ValueError(f"Invalid transactions on rows {', '.join(map(str, bad_rows))}")
+            rejected += int((~valid).sum())
+            amounts, timestamps, categories = amounts[valid], timestamps[valid], categories[valid]
+
+        # Only categories that occur in the chunk are registered with the account
+        categories = categories.remove_unused_categories()
+
+        # The balance may never drop below zero while the rows are applied in order. The account
+        # stays locked from the check until the chunk is recorded, so no withdrawal can come between.
+        with account.lock:
+            # While the balance plus every amount stays below 2**62 the int64 cumulative sum cannot
+            # wrap around; a chunk of larger sums is added up in Python ints instead
+            balance = account.get_balance()
+            if abs(balance) + np.abs(amounts).sum(dtype=np.float64) < 2 ** 62:
+                running_balance = balance + np.cumsum(amounts)
+            else:
+                running_balance = np.array(list(accumulate(amounts.tolist(), initial=balance))[1:], dtype=object)
+            out_of_range = (running_balance < 0) | (running_balance >= AMOUNT_LIMIT)
+            if out_of_range.any():
+                bad_row = int(np.argmax(out_of_range))
+                problem = "Insufficient funds for the withdrawal" if running_balance[bad_row] < 0 else "Balance out of range after the transaction"
+                raise ValueError(f"{problem} {bad_row + 1} rows into the chunk starting at row {first_row + 2}")
+
+            if len(amounts):
+                account.record_batch(
+                    amounts.tobytes(),
+                    timestamps.astype(np.int64).tobytes(),
+                    array("H", categories.codes.astype(np.uint16).tobytes()),
+                    list(categories.categories),
+                )
+
+        imported += len(amounts)
+        first_row += len(chunk)
+        if progress is not None:
+            progress(imported, rejected)
+
+    return imported, rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import historical Flazz card transactions from a CSV or Excel file.")
+    parser.add_argument("file", help="CSV or XLSX file with Category, Amount and Timestamp columns")
+    parser.add_argument("--account", required=True, help="10-digit Binusian ID Flazz number to import into")
+    parser.add_argument("--data-dir", default=DATA_DIR, help=f"bank data directory (default: {DATA_DIR})")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows read and applied per batch")
+    parser.add_argument("--skip-invalid", action="store_true", help="leave out invalid rows instead of stopping")
+    args = parser.parse_args(argv)
+
+    bank = Bank("MyFlazzID", data_dir=args.data_dir)
+    try:
+        account = bank.get_account(args.account)
+        if account is None:
+            print(f"Account {args.account} does not exist", file=sys.stderr)
+            return 1
+
+        start = time.perf_counter()
+        try:
+            imported, rejected = import_transactions(account, args.file, args.chunk_size, args.skip_invalid)
+        except ValueError as error:
+            print(f"Import stopped: {error}", file=sys.stderr)
+            return 1
+        elapsed = time.perf_counter() - start
+        print(f"Imported {imported:,} transactions ({rejected:,} rejected) in {elapsed:.2f}s")
+        return 0
+    finally:
+        bank.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# Background jobs for the Tk application.
+#
+# Long-running work such as exports runs on a small thread pool. Workers never touch Tk:
+# they post progress and results to a queue, and the Tk loop picks them up with after().
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLimitReached(Exception):
+    pass
+
+
+# Define a class for one submitted job, handed to the job function so it can report progress
+class Job:
+    def __init__(self, executor, name):
+        self.executor = executor
+        self.name = name
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    # Method to request cancellation. A queued job never starts; a running job stops at its
+    # next progress report.
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.executor.post("cancelled", self)
+
+    # Method for the job function to report progress; raises JobCancelled once cancelled
+    def report(self, done, total):
+        if self.cancelled:
+            raise JobCancelled(self.name)
+        self.executor.post("progress", self, done, total)
+
+
+# Define a class that runs jobs off the Tk thread and delivers their callbacks on it
+class JobExecutor:
+    def __init__(self, root, max_workers=2, max_jobs=4, poll_interval=50):
+        self.root = root
+        self.max_jobs = max_jobs  # Running plus queued jobs allowed at once
+        self.poll_interval = poll_interval  # Milliseconds between checks for job events
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flazz-job")
+        self.events = queue.Queue()
+        self.jobs = {}  # Job: (on_progress, on_done, on_error)
+        self.poll_id = None
+
+    # Method to submit function(job, *args, **kwargs). The callbacks run on the Tk thread:
+    # on_progress(job, done, total), on_done(job, result) and on_error(job, exception).
+    # Cancelled jobs call on_error with a JobCancelled exception.
+    def submit(self, name, function, *args, on_progress=None, on_done=None, on_error=None, **kwargs):
+        if len(self.jobs) >= self.max_jobs:
+            raise JobLimitReached(f"Already running {len(self.jobs)} jobs")
+
+        job = Job(self, name)
+        self.jobs[job] = (on_progress, on_done, on_error)
+        job.future = self.pool.submit(self.run, job, function, args, kwargs)
+        self.start_polling()
+        return job
+
+    def run(self, job, function, args, kwargs):
+        try:
+            if job.cancelled:
+                raise JobCancelled(job.name)
+            result = function(job, *args, **kwargs)
+        except JobCancelled:
+            self.post("cancelled", job)
+        except Exception as error:
+            self.post("error", job, error)
+        else:
+            self.post("done", job, result)
+
+    def post(self, kind, job, *values):
+        self.events.put((kind, job, values))
+
+    def start_polling(self):
+        if self.poll_id is None:
+            self.poll_id = self.root.after(self.poll_interval, self.poll)
+
+    # Method to deliver queued job events; keeps polling while jobs are outstanding
+    def poll(self):
+        self.poll_id = None
+        latest_progress = {}
+        while True:
+            try:
+                kind, job, values = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if job not in self.jobs:
+                continue
+            on_progress, on_done, on_error = self.jobs[job]
+            if kind == "progress":
+                # Only the newest progress of each job is worth showing
+                latest_progress[job] = values
+                continue
+            del self.jobs[job]
+            latest_progress.pop(job, None)
+            if kind == "done" and on_done is not None:
+                on_done(job, *values)
+            elif kind == "error" and on_error is not None:
+                on_error(job, *values)
+            elif kind == "cancelled" and on_error is not None:
+                on_error(job, JobCancelled(job.name))
+
+        for job, values in latest_progress.items():
+            on_progress = self.jobs[job][0]
+            if on_progress is not None:
+                on_progress(job, *values)
+
+        if self.jobs:
+            self.start_polling()
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            job.cancel()
+
+    # Method to cancel all jobs and stop the worker threads without waiting for them
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        if self.poll_id is not None:
+            self.root.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.jobs.clear()
@@ -0,0 +1,181 @@
+# Opt-in instrumentation of hot paths: call counts and latency histograms per operation, plus
+# counters of events (such as FlazzCharts counting blitted and full chart redraws).
+#
+# Nothing is measured until instrument() replaces a method with a timed wrapper, so the
+# application pays nothing while metrics are off. Latencies go into log-scale histograms with
+# four buckets per doubling (about 19% resolution), which take constant time and memory per
+# call no matter how many calls are recorded; percentiles are read from the bucket counts.
+#
+# Set FLAZZ_METRICS=1 to turn instrumentation on in the app. The stats are dumped on exit and
+# on SIGUSR1, and can be watched live in the app's diagnostics window.
+import atexit
+import functools
+import math
+import os
+import signal
+import sys
+import threading
+import time
+
+BUCKETS_PER_OCTAVE = 4
+BUCKET_COUNT = 40 * BUCKETS_PER_OCTAVE  # Up to 2**40 ns (about 18 minutes)
+PERCENTILES = (50, 95, 99)
+
+
+# Define a class for the latency histogram of one operation
+class LatencyHistogram:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.errors = 0  # Calls that raised
+        self.total = 0  # Nanoseconds
+        self.max = 0
+
+    # Method to record one call that took the given number of nanoseconds
+    def record(self, nanoseconds, failed=False):
+        index = min(int(math.log2(nanoseconds) * BUCKETS_PER_OCTAVE), BUCKET_COUNT - 1) if nanoseconds > 1 else 0
+        with self.lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += nanoseconds
+            if nanoseconds > self.max:
+                self.max = nanoseconds
+            if failed:
+                self.errors += 1
+
+    # Method to estimate a percentile in nanoseconds: the upper edge of the bucket it falls in
+    def percentile(self, percent):
+        with self.lock:
+            if not self.count:
+                return 0
+            rank = math.ceil(self.count * percent / 100)
+            seen = 0
+            for index, bucket in enumerate(self.buckets):
+                seen += bucket
+                if seen >= rank:
+                    return min(2 ** ((index + 1) / BUCKETS_PER_OCTAVE), self.max)
+            return self.max
+
+    # Method to get the stats as a dict of count, errors, total/max seconds and percentiles in seconds
+    def stats(self):
+        stats = {"count": self.count, "errors": self.errors, "total": self.total / 1e9, "max": self.max / 1e9}
+        for percent in PERCENTILES:
+            stats[f"p{percent}"] = self.percentile(percent) / 1e9
+        return stats
+
+
+# Define a class for the histograms and counters of the application
+class Metrics:
+    def __init__(self):
+        self.histograms = {}  # Operation name: LatencyHistogram
+        self.counters = {}  # Counter name: value
+        self.lock = threading.Lock()
+        self.instrumented = []  # (owner, attribute, original) of every wrapped method
+
+    def histogram(self, name):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = LatencyHistogram(name)
+            return self.histograms[name]
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Method to replace owner.attribute (a function or method) with a wrapper that records its latency
+    def instrument(self, owner, attribute, name=None):
+        original = getattr(owner, attribute)
+        histogram = self.histogram(name or f"{getattr(owner, '__name__', owner)}.{attribute}")
+        clock = time.perf_counter_ns
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                result = original(*args, **kwargs)
+            except BaseException:
+                histogram.record(clock() - start, failed=True)
+                raise
+            histogram.record(clock() - start)
+            return result
+
+        setattr(owner, attribute, timed)
+        self.instrumented.append((owner, attribute, original))
+        return histogram
+
+    # Method to put every instrumented method back
+    def uninstrument(self):
+        for owner, attribute, original in reversed(self.instrumented):
+            setattr(owner, attribute, original)
+        self.instrumented.clear()
+
+    def reset(self):
+        with self.lock:
+            histograms = list(self.histograms.values())
+            self.counters.clear()
+        for histogram in histograms:
+            with histogram.lock:
+                histogram.reset()
+
+    # Method to get {operation: stats} for every histogram with calls, plus {"counters": {...}}
+    def snapshot(self):
+        with self.lock:
+            histograms = list(self.histograms.values())
+            counters = dict(self.counters)
+        stats = {histogram.name: histogram.stats() for histogram in histograms if histogram.count}
+        stats["counters"] = counters
+        return stats
+
+    # Method to format the stats as a table
+    def dump(self):
+        snapshot = self.snapshot()
+        counters = snapshot.pop("counters")
+        lines = [f"{'operation':<36} {'calls':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'total s':>9}"]
+        for name, stats in sorted(snapshot.items(), key=lambda item: item[1]["total"], reverse=True):
+            errors = f"  ({stats['errors']} failed)" if stats["errors"] else ""
+            lines.append(f"{name:<36} {stats['count']:>8,} {stats['p50'] * 1e3:>9.3f} {stats['p95'] * 1e3:>9.3f} "
+                         f"{stats['p99'] * 1e3:>9.3f} {stats['max'] * 1e3:>9.3f} {stats['total']:>9.3f}{errors}")
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name:<36} {value:>8,}")
+        return "\n".join(lines)
+
+
+# The metrics of this process
+metrics = Metrics()
+
+
+def enabled_by_environment():
+    return os.environ.get("FLAZZ_METRICS", "") not in ("", "0")
+
+# Method to instrument the core hot paths and dump the stats on exit and on SIGUSR1.
+# Returns the metrics registry.
+def enable():
+    from FlazzCore import Account, Bank
+
+    if not metrics.instrumented:
+        for owner, attribute in ((Account, "deposit"), (Account, "withdraw"), (Bank, "transfer_funds")):
+            metrics.instrument(owner, attribute)
+        atexit.register(print_stats)
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            threading.Thread(target=dump_on_request, name="metrics-dump", daemon=True).start()
+            signal.signal(signal.SIGUSR1, lambda signum, frame: dump_requested.set())
+    return metrics
+
+def print_stats(file=None):
+    print(metrics.dump(), file=file or sys.stderr, flush=True)
+
+# The SIGUSR1 handler runs on the main thread between any two bytecodes, possibly while that
+# thread holds a histogram or registry lock, so it only sets this event and the dump is printed
+# from its own thread
+dump_requested = threading.Event()
+
+def dump_on_request():
+    while True:
+        dump_requested.wait()
+        dump_requested.clear()
+        print_stats()
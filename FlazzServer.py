@@ -0,0 +1,272 @@
+# Asyncio ingestion server for card-reader taps.
+#
+# Readers connect over TCP and send one JSON request per line:
+#   {"id": 1, "op": "deposit", "account": "1234567890", "amount": 50000}
+#   {"id": 2, "op": "withdraw", "account": "1234567890", "amount": 12000, "category": "Toll Road"}
+#   {"id": 3, "op": "transfer", "account": "1234567890", "to": "0987654321", "amount": 5000}
+#   {"id": 4, "op": "balance", "account": "1234567890"}
+# and get one JSON acknowledgement per request, in request order:
+#   {"id": 2, "ok": true, "balance": "38000.00"}    or    {"id": 2, "ok": false, "error": "insufficient funds"}
+# Amounts are rupiah with at most two decimal places, as numbers or strings such as "12500.50".
+# Balances are sent as exact two-decimal strings, since JSON numbers are read as floats by most
+# clients. The bank itself works in minor units (see FlazzCore.parse_amount and format_amount).
+#
+# Requests from all connections go through one bounded queue and are applied to the bank in
+# micro-batches. A full queue stops the server from reading more requests (backpressure), and
+# each connection may only have a limited number of unacknowledged requests. For a persistent
+# bank, acknowledgements are sent once the batch's journal records are on disk.
+#
+# Usage: python FlazzServer.py [--host HOST] [--port PORT] [--data-dir DIR]
+#        python FlazzServer.py --benchmark [--readers N] [--taps N]
+import argparse
+import asyncio
+import json
+import time
+
+from FlazzCore import Bank, SPENDING_CATEGORIES, DATA_DIR, current_timestamp, format_amount, parse_amount
+
+DEFAULT_PORT = 8765
+
+
+# Define a class for the tap server of a bank
+class TapServer:
+    def __init__(self, bank, max_batch=2048, queue_size=8192, max_in_flight=1024):
+        self.bank = bank
+        self.max_batch = max_batch  # Requests applied per batch at most
+        self.max_in_flight = max_in_flight  # Unacknowledged requests per connection
+        self.queue = asyncio.Queue(queue_size)
+        self.server = None
+        self.batcher = None
+        self.applied = 0  # Number of requests applied so far
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        self.batcher = asyncio.ensure_future(self.run_batcher())
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher.cancel()
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue(self.max_in_flight)  # Futures of this connection, in request order
+        responder = asyncio.ensure_future(self.send_responses(pending, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                future = loop.create_future()
+                await pending.put(future)
+                request = None
+                try:
+                    request = json.loads(line)
+                    event = self.parse_request(request)
+                except (ValueError, KeyError, TypeError) as error:
+                    future.set_result({"id": request.get("id") if isinstance(request, dict) else None, "ok": False, "error": str(error)})
+                    continue
+                await self.queue.put((event, future))
+        except ConnectionError:
+            pass
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+
+    async def send_responses(self, pending, writer):
+        try:
+            while True:
+                future = await pending.get()
+                if future is None:
+                    break
+                writer.write(json.dumps(await future).encode() + b"\n")
+                if pending.empty():
+                    await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    # Method to check a request and turn it into an (id, op, account, amount, category, to) event
+    def parse_request(self, request):
+        request = request if isinstance(request, dict) else {}
+        op = request["op"]
+        account = str(request["account"])
+        if op == "balance":
+            return request.get("id"), op, account, 0, None, None
+
+        amount = parse_amount(request["amount"])
+        if not amount > 0:
+            raise ValueError("amount must be a positive number")
+        if op == "deposit":
+            return request.get("id"), op, account, amount, "Deposit", None
+        if op == "withdraw":
+            category = request.get("category", "Other")
+            if category not in SPENDING_CATEGORIES:
+                raise ValueError(f"unknown category {category!r}")
+            return request.get("id"), op, account, amount, category, None
+        if op == "transfer":
+            return request.get("id"), op, account, amount, "Transfer", str(request["to"])
+        raise ValueError(f"unknown op {op!r}")
+
+    async def run_batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            responses = self.apply_batch([event for event, future in batch])
+            self.applied += len(batch)
+
+            storage = self.bank.storage
+            if storage is not None:
+                # Acknowledge once the group commit holding this batch is done, while the next batch is applied
+                sequence = storage.log.appended
+                asyncio.ensure_future(self.acknowledge_durable(loop, storage.log, sequence, batch, responses))
+            else:
+                for (event, future), response in zip(batch, responses):
+                    future.set_result(response)
+
+    async def acknowledge_durable(self, loop, log, sequence, batch, responses):
+        await loop.run_in_executor(None, log.wait_durable, sequence)
+        for (event, future), response in zip(batch, responses):
+            future.set_result(response)
+
+    # Method to apply a batch of events to the bank, all with the same timestamp
+    def apply_batch(self, events):
+        bank = self.bank
+        timestamp = current_timestamp()
+        responses = []
+        for request_id, op, number, amount, category, to in events:
+            account = bank.get_account(number)
+            if account is None:
+                responses.append({"id": request_id, "ok": False, "error": "unknown account"})
+                continue
+
+            # A failing event only fails its own request, never the batch or the batcher
+            try:
+                if op == "deposit":
+                    account.deposit(amount, category, timestamp)
+                    ok = True
+                elif op == "withdraw":
+                    ok = account.withdraw(amount, category, timestamp)
+                elif op == "transfer":
+                    ok = bank.transfer_funds(number, to, amount)
+                else:
+                    ok = True
+            except Exception as error:
+                responses.append({"id": request_id, "ok": False, "error": str(error) or type(error).__name__})
+                continue
+
+            if ok:
+                responses.append({"id": request_id, "ok": True, "balance": format_amount(account.balance)})
+            else:
+                responses.append({"id": request_id, "ok": False, "error": "insufficient funds" if op == "withdraw" else "transfer failed"})
+        return responses
+
+
+# Define a class for a reader connection that pipelines requests and matches the acknowledgements
+class TapClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.waiting = asyncio.Queue()  # Futures in request order; the server answers in order
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=DEFAULT_PORT):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    # Method to send a request without waiting; returns a future for its acknowledgement
+    def send(self, op, account, amount=None, **fields):
+        self.next_id += 1
+        request = {"id": self.next_id, "op": op, "account": account, **fields}
+        if amount is not None:
+            request["amount"] = amount
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.put_nowait(future)
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        return future
+
+    async def request(self, op, account, amount=None, **fields):
+        future = self.send(op, account, amount, **fields)
+        await self.writer.drain()
+        return await future
+
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            (await self.waiting.get()).set_result(json.loads(line))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.receiver.cancel()
+
+
+# Benchmark: several readers tapping concurrently against an in-memory bank
+async def benchmark(readers=8, taps=200000, window=512):
+    bank = Bank("Benchmark")
+    numbers = [f"{i:010d}" for i in range(readers * 10)]
+    for number in numbers:
+        bank.create_account(number, "Benchmark", 0)
+
+    server = TapServer(bank)
+    port = await server.start(port=0)
+
+    async def run_reader(reader_index):
+        client = await TapClient.connect(port=port)
+        own = numbers[reader_index * 10:(reader_index + 1) * 10]
+        futures = []
+        for i in range(taps // readers):
+            op = "deposit" if i % 2 == 0 else "withdraw"
+            futures.append(client.send(op, own[i % 10], 1000 if op == "deposit" else 400, category="Toll Road"))
+            if len(futures) >= window:
+                await client.writer.drain()
+                await asyncio.gather(*futures)
+                futures = []
+        await client.writer.drain()
+        await asyncio.gather(*futures)
+        await client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_reader(i) for i in range(readers)))
+    elapsed = time.perf_counter() - start
+    await server.stop()
+    print(f"{server.applied:,} taps from {readers} readers in {elapsed:.2f}s ({server.applied / elapsed:,.0f} taps/s)")
+
+
+async def serve(host, port, data_dir):
+    bank = Bank("MyFlazzID", data_dir=data_dir)
+    server = TapServer(bank)
+    try:
+        port = await server.start(host, port)
+        print(f"Listening on {host}:{port}")
+        await server.server.serve_forever()
+    finally:
+        bank.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flazz card tap ingestion server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data-dir", default=DATA_DIR, help=f"bank data directory (default: {DATA_DIR})")
+    parser.add_argument("--benchmark", action="store_true", help="run a local throughput benchmark instead of serving")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent readers for --benchmark")
+    parser.add_argument("--taps", type=int, default=200000, help="total taps for --benchmark")
+    args = parser.parse_args()
+
+    try:
+        if args.benchmark:
+            asyncio.run(benchmark(args.readers, args.taps))
+        else:
+            asyncio.run(serve(args.host, args.port, args.data_dir))
+    except KeyboardInterrupt:
+        pass
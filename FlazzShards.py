@@ -0,0 +1,364 @@
+# Sharded bank: the accounts are spread over several worker processes by a hash of the account
+# number, so that a bank is not limited to one core and one process's memory.
+#
+# Every shard process holds a Bank of its own (persisted to DATA_DIR/shard-N when the sharded
+# bank has a data directory) and answers batches of operations sent over a pipe. ShardedBank
+# routes each operation to the shard owning its account, and sends the batches for different
+# shards before waiting for any reply, so the shards work in parallel.
+#
+# A transfer between accounts on the same shard is an ordinary Bank.transfer_funds. A transfer
+# across shards runs a two-phase protocol: the source shard puts a hold on the amount (so it
+# cannot be spent meanwhile) and the target shard checks the account; only if both vote yes are
+# both legs committed, otherwise the hold is released. Holds live in the shard's memory, so a
+# transfer caught between the two phases by a crash is not recovered.
+#
+# Usage: python FlazzShards.py [--shards N ...] [--accounts N] [--operations N]
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+
+from FlazzCore import AMOUNT_LIMIT, Bank, SPENDING_CATEGORIES, current_timestamp
+
+BATCH_SIZE = 1000  # Operations per message in the benchmark
+
+
+# Define an exception for an operation that raised in its shard process. It is sent back as the
+# result of that operation; the shard carries on with the rest of the batch.
+class ShardError(Exception):
+    pass
+
+
+# Define a class for the bank of one shard process and its transfers in progress
+class Shard:
+    def __init__(self, bank):
+        self.bank = bank
+        self.debits = {}  # Transfer id: (account, amount) held on this shard
+        self.credits = {}  # Transfer id: (account, amount) to credit on this shard
+        self.held = {}  # Account number: total amount on hold
+        self.incoming = {}  # Account number: total amount of prepared credits
+        self.operations = {
+            "create": self.create,
+            "balance": self.balance,
+            "deposit": self.deposit,
+            "withdraw": self.withdraw,
+            "transfer": self.transfer,
+            "prepare_debit": self.prepare_debit,
+            "prepare_credit": self.prepare_credit,
+            "commit": self.commit,
+            "abort": self.abort,
+        }
+
+    # Method to apply one operation, a tuple (name, arguments...)
+    def handle(self, operation):
+        return self.operations[operation[0]](*operation[1:])
+
+    def available(self, account):
+        return account.balance - self.held.get(account.account_number, 0)
+
+    def create(self, account_number, account_holder, initial_balance):
+        return self.bank.create_account(account_number, account_holder, initial_balance) is not None
+
+    def balance(self, account_number):
+        account = self.bank.get_account(account_number)
+        return None if account is None else account.balance
+
+    def deposit(self, account_number, amount, category="Deposit"):
+        account = self.bank.get_account(account_number)
+        if account is None or amount <= 0:
+            return False
+        account.deposit(amount, category)
+        return True
+
+    def withdraw(self, account_number, amount, category):
+        account = self.bank.get_account(account_number)
+        if account is None or amount <= 0 or amount > self.available(account):
+            return False
+        return account.withdraw(amount, category)
+
+    def transfer(self, from_account, to_account, amount):
+        account = self.bank.get_account(from_account)
+        if account is None or amount > self.available(account):
+            return False
+        return self.bank.transfer_funds(from_account, to_account, amount)
+
+    # Phase one of a cross-shard transfer: vote on it, holding the amount on the source account
+    def prepare_debit(self, transfer_id, account_number, amount):
+        account = self.bank.get_account(account_number)
+        if account is None or amount <= 0 or amount > self.available(account):
+            return False
+        self.debits[transfer_id] = (account, amount)
+        self.held[account_number] = self.held.get(account_number, 0) + amount
+        return True
+
+    # The target votes yes only if every prepared credit fits its balance, so a commit cannot fail
+    def prepare_credit(self, transfer_id, account_number, amount):
+        account = self.bank.get_account(account_number)
+        incoming = self.incoming.get(account_number, 0) + amount
+        if account is None or amount <= 0 or account.balance + incoming >= AMOUNT_LIMIT:
+            return False
+        self.credits[transfer_id] = (account, amount)
+        self.incoming[account_number] = incoming
+        return True
+
+    # Phase two: apply this shard's leg of a transfer both shards voted for
+    def commit(self, transfer_id, timestamp):
+        if transfer_id in self.debits:
+            account, amount = self.release(transfer_id, self.debits, self.held)
+            account.record(-amount, timestamp, "Transfer")
+        else:
+            account, amount = self.release(transfer_id, self.credits, self.incoming)
+            account.record(amount, timestamp, "Transfer")
+        return True
+
+    def abort(self, transfer_id):
+        if transfer_id in self.debits:
+            self.release(transfer_id, self.debits, self.held)
+        elif transfer_id in self.credits:
+            self.release(transfer_id, self.credits, self.incoming)
+        return True
+
+    # Helper function to forget a prepared leg and take its amount off the account's total
+    def release(self, transfer_id, legs, totals):
+        account, amount = legs.pop(transfer_id)
+        remaining = totals[account.account_number] - amount
+        if remaining:
+            totals[account.account_number] = remaining
+        else:
+            del totals[account.account_number]
+        return account, amount
+
+
+# Helper function to apply a batch of operations, answering an operation that raises with a
+# ShardError instead of stopping the shard
+def apply_operations(shard, batch):
+    results = []
+    for operation in batch:
+        try:
+            results.append(shard.handle(operation))
+        except Exception as error:
+            results.append(ShardError(f"{operation[0]} failed: {error!r}"))
+    return results
+
+
+# Main loop of a shard process: answer every batch of operations with the list of their results
+def run_shard(connection, bank_name, data_dir):
+    bank = Bank(bank_name, data_dir=data_dir)
+    shard = Shard(bank)
+    try:
+        while True:
+            try:
+                batch = connection.recv()
+            except EOFError:
+                break
+            if batch is None:
+                break
+            connection.send(apply_operations(shard, batch))
+    finally:
+        bank.close()
+        connection.close()
+
+
+# Define a class for a bank whose accounts are spread over shard processes
+class ShardedBank:
+    def __init__(self, shard_count, bank_name="MyFlazzID", data_dir=None):
+        self.shard_count = shard_count
+        if data_dir is not None:
+            check_shard_count(data_dir, shard_count)
+
+        self.connections = []
+        self.processes = []
+        self.locks = []  # One per connection; code that takes several takes them in shard order
+        for index in range(shard_count):
+            parent, child = multiprocessing.Pipe()
+            shard_dir = None if data_dir is None else os.path.join(data_dir, f"shard-{index}")
+            process = multiprocessing.Process(target=run_shard, args=(child, bank_name, shard_dir), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+            self.locks.append(threading.Lock())
+        self.transfer_ids = itertools.count()
+
+    # Helper function to get the index of the shard that owns an account (stable across processes,
+    # unlike hash())
+    def shard_of(self, account_number):
+        return zlib.crc32(str(account_number).encode()) % self.shard_count
+
+    # Method to send batches of operations to several shards at once. batches is {shard: [operation, ...]};
+    # returns {shard: [result, ...]}.
+    def call(self, batches):
+        shards = sorted(batches)
+        for shard in shards:
+            self.locks[shard].acquire()
+        try:
+            for shard in shards:
+                self.connections[shard].send(batches[shard])
+            return {shard: self.connections[shard].recv() for shard in shards}
+        finally:
+            for shard in shards:
+                self.locks[shard].release()
+
+    # Method to apply a list of single-account operations: ("create", number, holder, balance),
+    # ("balance", number), ("deposit", number, amount[, category]) and ("withdraw", number, amount,
+    # category). Operations on one shard are applied in order; returns their results in order. An
+    # operation that raised in its shard has a ShardError as its result.
+    def execute(self, operations):
+        batches = {}
+        positions = {}
+        for position, operation in enumerate(operations):
+            if operation[0] not in ("create", "balance", "deposit", "withdraw"):
+                raise ValueError(f"unknown operation {operation[0]!r}")
+            shard = self.shard_of(operation[1])
+            batches.setdefault(shard, []).append(operation)
+            positions.setdefault(shard, []).append(position)
+
+        results = [None] * len(operations)
+        for shard, replies in self.call(batches).items():
+            for position, result in zip(positions[shard], replies):
+                results[position] = result
+        return results
+
+    def create_account(self, account_number, account_holder, initial_balance):
+        # Create a new account if the account number is unique; returns whether it was created
+        return self.execute_one(("create", account_number, account_holder, initial_balance))
+
+    def get_balance(self, account_number):
+        # Get the balance of an account, None if there is no such account
+        return self.execute_one(("balance", account_number))
+
+    def deposit(self, account_number, amount, category="Deposit"):
+        return self.execute_one(("deposit", account_number, amount, category))
+
+    def withdraw(self, account_number, amount, category):
+        # Withdraw funds if there are sufficient funds not on hold for a transfer
+        return self.execute_one(("withdraw", account_number, amount, category))
+
+    # Method to apply a single operation and return its result, raising its ShardError if it failed
+    def execute_one(self, operation):
+        result = self.execute([operation])[0]
+        if isinstance(result, ShardError):
+            raise result
+        return result
+
+    def transfer_funds(self, from_account, to_account, amount):
+        # Transfer funds from one account to another if there are sufficient funds (see transfer_many)
+        return self.transfer_many([(from_account, to_account, amount)])[0]
+
+    def transfer_many(self, transfers):
+        # Apply a list of (from_account, to_account, amount) transfers and return a list telling
+        # which of them succeeded. Transfers within a shard are applied in order in the first
+        # phase; the cross-shard ones are all prepared together and then committed or aborted
+        # together, so money they move is only available to the transfers after this batch.
+        results = [False] * len(transfers)
+        prepared = {}  # Shard: [operation, ...] of the first phase
+        replies_for = {}  # Shard: [(position, transfer id or None), ...] matching those operations
+        cross_shard = {}  # Transfer id: (position, source shard, target shard)
+        for position, (from_account, to_account, amount) in enumerate(transfers):
+            source = self.shard_of(from_account)
+            target = self.shard_of(to_account)
+            if source == target:
+                prepared.setdefault(source, []).append(("transfer", from_account, to_account, amount))
+                replies_for.setdefault(source, []).append((position, None))
+            else:
+                transfer_id = next(self.transfer_ids)
+                cross_shard[transfer_id] = (position, source, target)
+                prepared.setdefault(source, []).append(("prepare_debit", transfer_id, from_account, amount))
+                replies_for.setdefault(source, []).append((position, transfer_id))
+                prepared.setdefault(target, []).append(("prepare_credit", transfer_id, to_account, amount))
+                replies_for.setdefault(target, []).append((position, transfer_id))
+
+        # Phase one: same-shard transfers and votes
+        votes = {}  # Transfer id: number of yes votes
+        for shard, replies in self.call(prepared).items():
+            for (position, transfer_id), result in zip(replies_for[shard], replies):
+                if transfer_id is None:
+                    results[position] = result is True
+                elif result is True:
+                    votes[transfer_id] = votes.get(transfer_id, 0) + 1
+
+        # Phase two: commit the transfers both shards voted for, abort the rest
+        if cross_shard:
+            timestamp = current_timestamp()
+            decisions = {}
+            for transfer_id, (position, source, target) in cross_shard.items():
+                committed = votes.get(transfer_id) == 2
+                decision = ("commit", transfer_id, timestamp) if committed else ("abort", transfer_id)
+                decisions.setdefault(source, []).append(decision)
+                decisions.setdefault(target, []).append(decision)
+                results[position] = committed
+            for replies in self.call(decisions).values():
+                for result in replies:
+                    if isinstance(result, ShardError):
+                        raise result
+        return results
+
+    def close(self):
+        # Stop the shard processes, which close (and snapshot) their banks
+        for shard in range(self.shard_count):
+            with self.locks[shard]:
+                try:
+                    self.connections[shard].send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+        for process, connection in zip(self.processes, self.connections):
+            process.join()
+            connection.close()
+
+
+# Helper function to check that a data directory is always opened with the same number of shards,
+# since that decides which shard holds each account
+def check_shard_count(data_dir, shard_count):
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, "shards.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as shards_file:
+            saved = json.load(shards_file)["shards"]
+        if saved != shard_count:
+            raise ValueError(f"{data_dir} holds {saved} shards, not {shard_count}")
+    else:
+        with open(path, "w", encoding="utf-8") as shards_file:
+            json.dump({"shards": shard_count}, shards_file)
+
+
+# Benchmark: deposits, withdrawals and transfers (half of them across shards for 2+ shards) in batches
+def benchmark(shard_count, account_count=10000, operation_count=200000):
+    bank = ShardedBank(shard_count, "Benchmark")
+    try:
+        numbers = [f"{i:010d}" for i in range(account_count)]
+        for first in range(0, account_count, BATCH_SIZE):
+            bank.execute([("create", number, "Benchmark", 1000000) for number in numbers[first:first + BATCH_SIZE]])
+
+        start = time.perf_counter()
+        for first in range(0, operation_count, BATCH_SIZE):
+            operations = []
+            transfers = []
+            for i in range(first, min(first + BATCH_SIZE, operation_count)):
+                number = numbers[i % account_count]
+                if i % 4 == 0:
+                    transfers.append((number, numbers[(i * 7 + 1) % account_count], 100))
+                elif i % 4 == 1:
+                    operations.append(("withdraw", number, 400, SPENDING_CATEGORIES[i % len(SPENDING_CATEGORIES)]))
+                else:
+                    operations.append(("deposit", number, 1000))
+            bank.execute(operations)
+            bank.transfer_many(transfers)
+        elapsed = time.perf_counter() - start
+    finally:
+        bank.close()
+    print(f"{shard_count} shard(s): {operation_count:,} operations in {elapsed:.2f}s ({operation_count / elapsed:,.0f} ops/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the sharded Flazz bank.")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4], help="shard counts to run with")
+    parser.add_argument("--accounts", type=int, default=10000)
+    parser.add_argument("--operations", type=int, default=200000)
+    args = parser.parse_args()
+
+    for shard_count in args.shards:
+        benchmark(shard_count, args.accounts, args.operations)
@@ -0,0 +1,185 @@
+# Paginated PDF statements of an account's transaction history.
+#
+# Rows are streamed from the ledger in chunks (see FlazzExport.iter_history_chunks) and laid
+# out page by page: every finished page is compressed and handed to reportlab, so no
+# per-transaction objects are kept around. Page geometry, column positions and fonts are
+# computed once per page size and reused for every statement.
+#
+# Usage: python FlazzStatement.py --benchmark ROWS [--output FILE]
+import argparse
+import os
+import tempfile
+import time
+from functools import lru_cache
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from FlazzCore import Transaction, format_timestamp
+from FlazzExport import iter_history_chunks, history_size, format_timestamps
+
+FONT = "Helvetica"
+BOLD_FONT = "Helvetica-Bold"
+FONT_SIZE = 9
+TITLE_SIZE = 14
+LEADING = 13  # Distance between rows
+MARGIN = 50
+
+
+# Define a class for the layout of a statement page. Instances are cached by page size.
+class StatementLayout:
+    def __init__(self, pagesize):
+        self.pagesize = pagesize
+        width, height = pagesize
+
+        self.title_y = height - MARGIN
+        self.info_y = self.title_y - 18
+        self.header_y = self.info_y - 22
+        self.rule_y = self.header_y - 5
+        self.first_row_y = self.header_y - LEADING - 4
+        self.footer_y = MARGIN - 20
+        self.rows_per_page = int((self.first_row_y - MARGIN) // LEADING) + 1
+
+        # Left edges of the text columns and right edges of the number columns
+        self.date_x = MARGIN
+        self.category_x = MARGIN + 115
+        self.amount_right = width - MARGIN - 110
+        self.balance_right = width - MARGIN
+        self.right_edge = width - MARGIN
+
+@lru_cache(maxsize=None)
+def get_layout(pagesize=letter):
+    return StatementLayout(pagesize)
+
+
+# Define a class that renders one statement to a PDF file
+class StatementRenderer:
+    def __init__(self, account, pagesize=letter, title="Transaction History", start=None, end=None):
+        self.account = account
+        self.layout = get_layout(tuple(pagesize))
+        self.title = title
+        self.start = start  # Optional time window of the statement (see FlazzExport.iter_history_chunks)
+        self.end = end
+
+    def page_count(self, rows):
+        return max(1, -(-rows // self.layout.rows_per_page))
+
+    # Method to draw the parts every page shares
+    def draw_page_frame(self, pdf, page, pages):
+        layout = self.layout
+        pdf.setFont(BOLD_FONT, TITLE_SIZE)
+        pdf.drawString(MARGIN, layout.title_y, self.title)
+
+        pdf.setFont(FONT, FONT_SIZE)
+        info = f"{self.account.account_holder} - Flazz {self.account.account_number}"
+        if self.start is not None or self.end is not None:
+            info += f"    Period: {self.format_bound(self.start, 'start')} to {self.format_bound(self.end, 'now')}"
+        pdf.drawString(MARGIN, layout.info_y, info)
+        pdf.drawRightString(layout.right_edge, layout.footer_y, f"Page {page} of {pages}")
+
+        pdf.setFont(BOLD_FONT, FONT_SIZE)
+        pdf.drawString(layout.date_x, layout.header_y, "Timestamp")
+        pdf.drawString(layout.category_x, layout.header_y, "Category")
+        pdf.drawRightString(layout.amount_right, layout.header_y, "Amount (IDR)")
+        pdf.drawRightString(layout.balance_right, layout.header_y, "Balance (IDR)")
+        pdf.line(MARGIN, layout.rule_y, layout.right_edge, layout.rule_y)
+        pdf.setFont(FONT, FONT_SIZE)
+
+    @staticmethod
+    def format_bound(bound, default):
+        if bound is None:
+            return default
+        return bound if isinstance(bound, str) else format_timestamp(bound)
+
+    # Method to draw the rows of one page. Text columns go through a single text object each.
+    def draw_rows(self, pdf, dates, categories, amounts, balances):
+        layout = self.layout
+        for x, lines in ((layout.date_x, dates), (layout.category_x, categories)):
+            text = pdf.beginText(x, layout.first_row_y)
+            text.setFont(FONT, FONT_SIZE)
+            text.setLeading(LEADING)
+            text.textLines(lines)
+            pdf.drawText(text)
+
+        y = layout.first_row_y
+        for amount, balance in zip(amounts, balances):
+            pdf.drawRightString(layout.amount_right, y, amount)
+            pdf.drawRightString(layout.balance_right, y, balance)
+            y -= LEADING
+
+    # Method to render the statement. progress(rows_written, total_rows) is called per page.
+    def render(self, file_path, progress=None):
+        layout = self.layout
+        rows_per_page = layout.rows_per_page
+        total = history_size(self.account, self.start, self.end)
+        pages = self.page_count(total)
+
+        pdf = canvas.Canvas(file_path, pagesize=layout.pagesize, pageCompression=1)
+        pdf.setTitle(self.title)
+
+        page = 1
+        written = 0
+        pending = ([], [], [], [])  # Rows of the page being filled: dates, categories, amounts, balances
+        # Chunks are a whole number of pages, so pages only get split at the end of the history
+        for categories, amounts, timestamps, balances in iter_history_chunks(self.account, rows_per_page * 64, self.start, self.end):
+            columns = (
+                format_timestamps(timestamps).tolist(),
+                categories.tolist(),
+                list(map(Transaction.format_currency, amounts.tolist())),
+                list(map(Transaction.format_currency, balances.tolist())),
+            )
+            for start in range(0, len(amounts), rows_per_page):
+                for page_column, column in zip(pending, columns):
+                    page_column.extend(column[start:start + rows_per_page])
+                if len(pending[0]) < rows_per_page and written + len(pending[0]) < total:
+                    continue
+                self.draw_page_frame(pdf, page, pages)
+                self.draw_rows(pdf, *pending)
+                pdf.showPage()
+                written += len(pending[0])
+                pending = ([], [], [], [])
+                page += 1
+                if progress is not None:
+                    progress(written, total)
+
+        if total == 0:
+            self.draw_page_frame(pdf, 1, 1)
+            pdf.drawString(layout.date_x, layout.first_row_y, "No transactions yet.")
+            pdf.showPage()
+        pdf.save()
+        return pages
+
+
+# Method to render the PDF statement of an account, optionally only of the transactions with
+# start <= timestamp < end. Returns the number of pages.
+def render_statement(account, file_path, pagesize=letter, progress=None, start=None, end=None):
+    return StatementRenderer(account, pagesize, start=start, end=end).render(file_path, progress)
+
+
+# Benchmark: render a statement of a synthetic account with the given number of rows
+def benchmark(rows, output=None):
+    from array import array
+    from FlazzCore import Account, SPENDING_CATEGORIES
+
+    account = Account("0000000000", "Benchmark", 0)
+    categories = ["Deposit"] + SPENDING_CATEGORIES
+    codes = array("H", (0 if i % 4 == 0 else 1 + i % len(SPENDING_CATEGORIES) for i in range(rows)))
+    amounts = array("q", (10000000 if code == 0 else -1250000 for code in codes))
+    timestamps = array("q", range(1_700_000_000, 1_700_000_000 + rows * 60, 60))
+    account.record_batch(amounts, timestamps, codes, categories)
+
+    if output is None:
+        handle, output = tempfile.mkstemp(suffix=".pdf")
+        os.close(handle)
+    start = time.perf_counter()
+    pages = render_statement(account, output)
+    elapsed = time.perf_counter() - start
+    print(f"{rows:,} rows, {pages:,} pages in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s, {os.path.getsize(output) / 1e6:.1f} MB) -> {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Flazz PDF statement rendering.")
+    parser.add_argument("--benchmark", type=int, default=100000, metavar="ROWS", help="number of transactions to render")
+    parser.add_argument("--output", help="PDF file to write (default: a temporary file)")
+    args = parser.parse_args()
+    benchmark(args.benchmark, args.output)
@@ -0,0 +1,415 @@
+# Durable storage for the Flazz bank: an append-only transaction journal with group commit,
+# plus compact snapshots that are memory-mapped at startup.
+#
+# A data directory holds one snapshot file and the journals written since that snapshot:
+#   snapshot.dat        all accounts with their ledger arrays, tagged with a journal generation
+#   journal-<gen>.log   records appended after the snapshot of that generation was started
+#
+# Money is stored as int64 minor units (see FlazzCore.MINOR_UNITS). Files of format version 1,
+# which stored float rupiah, are refused rather than read.
+#
+# Every journal record carries the position of the transaction in its account's ledger, so
+# replaying a record that is already part of the snapshot is skipped. This lets a checkpoint
+# switch to a new journal first and write the snapshot afterwards without stopping writers.
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+SNAPSHOT_MAGIC = b"FLZS"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FILE = "snapshot.dat"
+
+SNAPSHOT_HEADER = struct.Struct("<4sHQI")  # magic, version, journal generation, account count
+ACCOUNT_HEADER = struct.Struct("<qqIQ")  # opening balance, balance, category count, transaction count
+CATEGORY_ENTRY = struct.Struct("<qQ")  # category total, category count
+STRING_LENGTH = struct.Struct("<H")
+
+# Journals start with a header since version 2; version 1 journals had none
+JOURNAL_MAGIC = b"FLZJ"
+JOURNAL_VERSION = 2
+JOURNAL_HEADER = struct.Struct("<4sH")  # magic, version
+
+RECORD_HEADER = struct.Struct("<cII")  # record type, payload length, CRC32 of the payload
+RECORD_ACCOUNT = b"A"
+RECORD_TRANSACTION = b"T"
+RECORD_BATCH = b"B"
+RECORD_TRANSFER = b"X"
+ACCOUNT_RECORD = struct.Struct("<q")  # opening balance
+TRANSACTION_RECORD = struct.Struct("<Qqq")  # ledger index, amount, timestamp
+TRANSFER_RECORD = struct.Struct("<QQqq")  # ledger index in the source and target account, amount, timestamp
+BATCH_RECORD = struct.Struct("<QQH3s")  # ledger index, transaction count, category count, column typecodes
+
+# Account data read back from a snapshot; the last three fields are the ledger column arrays
+SnapshotAccount = namedtuple("SnapshotAccount", [
+    "account_number", "account_holder", "opening_balance", "balance",
+    "categories", "category_totals", "category_counts", "amounts", "timestamps", "category_codes",
+])
+
+# Journal records as returned by BankStorage.replay
+AccountRecord = namedtuple("AccountRecord", ["account_number", "account_holder", "opening_balance"])
+TransactionRecord = namedtuple("TransactionRecord", ["account_number", "index", "amount", "timestamp", "category"])
+TransferRecord = namedtuple("TransferRecord", ["from_account", "from_index", "to_account", "to_index", "amount", "timestamp"])
+BatchRecord = namedtuple("BatchRecord", ["account_number", "index", "amounts", "timestamps", "category_codes", "categories"])
+
+
+class StorageError(Exception):
+    pass
+
+
+# Helper functions for length-prefixed UTF-8 strings
+def pack_string(text):
+    data = text.encode("utf-8")
+    return STRING_LENGTH.pack(len(data)) + data
+
+def unpack_string(buffer, offset):
+    (length,) = STRING_LENGTH.unpack_from(buffer, offset)
+    offset += STRING_LENGTH.size
+    return bytes(buffer[offset:offset + length]).decode("utf-8"), offset + length
+
+# Helper function to read a typed array column out of a (memory-mapped) buffer
+def unpack_column(buffer, offset, typecode, count):
+    column = array(typecode)
+    end = offset + count * column.itemsize
+    with memoryview(buffer)[offset:end] as view:
+        column.frombytes(view)
+    return column, end
+
+# Helper function to read the int64 amount column of an account or batch
+def unpack_amounts(buffer, offset, typecode, count):
+    if typecode != "q":
+        raise StorageError(f"amounts stored as {typecode!r} rather than int64 minor units")
+    return unpack_column(buffer, offset, typecode, count)
+
+
+# Helper function to open a journal for appending, starting new (empty) files with the journal header
+def open_journal(path):
+    journal_file = open(path, "ab")
+    if journal_file.tell() == 0:
+        journal_file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+    return journal_file
+
+
+# Define a class for an append-only journal file with group commit. Records are buffered and a
+# background thread writes and fsyncs them in groups, so many writes share one fsync.
+class TransactionLog:
+    def __init__(self, path, commit_interval=0.01):
+        self.path = path
+        self.commit_interval = commit_interval  # Time a group waits for more records before its fsync
+        self.file = open_journal(path)
+
+        self.condition = threading.Condition()
+        self.commit_lock = threading.Lock()  # Serializes writes to the file
+        self.buffer = bytearray()
+        self.appended = 0  # Number of records appended
+        self.durable = 0  # Number of records known to be on disk
+        self.closed = False
+
+        self.flusher = threading.Thread(target=self.run_flusher, name="flazz-journal", daemon=True)
+        self.flusher.start()
+
+    # Method to append an encoded record. With wait=True the call returns only after the group
+    # holding the record has been fsynced.
+    def append(self, record, wait=False):
+        with self.condition:
+            if self.closed:
+                raise StorageError("journal is closed")
+            self.buffer += record
+            self.appended += 1
+            sequence = self.appended
+            self.condition.notify_all()
+        if wait:
+            self.wait_durable(sequence)
+        return sequence
+
+    def wait_durable(self, sequence):
+        with self.condition:
+            while self.durable < sequence:
+                self.condition.wait()
+
+    # Method to write and fsync everything appended so far
+    def commit(self):
+        with self.commit_lock:
+            with self.condition:
+                data, self.buffer = self.buffer, bytearray()
+                sequence = self.appended
+            if data:
+                self.file.write(data)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            with self.condition:
+                self.durable = max(self.durable, sequence)
+                self.condition.notify_all()
+
+    def run_flusher(self):
+        while True:
+            with self.condition:
+                while not self.buffer and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+            # Give concurrent writers a moment to join this group
+            time.sleep(self.commit_interval)
+            self.commit()
+
+    # Method to commit pending records and continue in a new file. Returns the number of records
+    # appended before the switch.
+    def rotate(self, path):
+        with self.commit_lock:
+            with self.condition:
+                data, self.buffer = self.buffer, bytearray()
+                sequence = self.appended
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = open_journal(path)
+            self.path = path
+            with self.condition:
+                self.durable = max(self.durable, sequence)
+                self.condition.notify_all()
+        return sequence
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.flusher.join()
+        self.commit()
+        self.file.close()
+
+
+# Define a class for the data directory of a bank: snapshot loading, journal replay and checkpoints
+class BankStorage:
+    def __init__(self, directory, commit_interval=0.01, checkpoint_every=100000):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.checkpoint_every = checkpoint_every  # Journal records between automatic snapshots
+        self.generation = 0
+        self.checkpoint_sequence = 0  # Journal records appended before the last checkpoint's rotation
+        self.checkpoint_pending = False  # Guarded by the journal's condition
+        self.bank = None
+        self.log = None
+        self.checkpoint_lock = threading.RLock()  # Reentrant so close can checkpoint while holding it
+        os.makedirs(directory, exist_ok=True)
+
+    def snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_FILE)
+
+    def journal_path(self, generation):
+        return os.path.join(self.directory, f"journal-{generation}.log")
+
+    # Method to read all accounts of the snapshot, if there is one
+    def read_snapshot(self):
+        path = self.snapshot_path()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return []
+
+        with open(path, "rb") as snapshot_file:
+            with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                magic, version, generation, account_count = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+                if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                    raise StorageError(f"{path} is not a supported snapshot file")
+                self.generation = generation
+                offset = SNAPSHOT_HEADER.size
+                bank_name, offset = unpack_string(buffer, offset)
+
+                accounts = []
+                for _ in range(account_count):
+                    account_number, offset = unpack_string(buffer, offset)
+                    account_holder, offset = unpack_string(buffer, offset)
+                    opening_balance, balance, category_count, count = ACCOUNT_HEADER.unpack_from(buffer, offset)
+                    offset += ACCOUNT_HEADER.size
+                    typecodes = bytes(buffer[offset:offset + 3]).decode("ascii")
+                    offset += 3
+
+                    categories, totals, counts = [], [], []
+                    for _ in range(category_count):
+                        category, offset = unpack_string(buffer, offset)
+                        total, category_transactions = CATEGORY_ENTRY.unpack_from(buffer, offset)
+                        offset += CATEGORY_ENTRY.size
+                        categories.append(category)
+                        totals.append(total)
+                        counts.append(category_transactions)
+
+                    amounts, offset = unpack_amounts(buffer, offset, typecodes[0], count)
+                    timestamps, offset = unpack_column(buffer, offset, typecodes[1], count)
+                    codes, offset = unpack_column(buffer, offset, typecodes[2], count)
+                    accounts.append(SnapshotAccount(account_number, account_holder, opening_balance, balance,
+                                                    categories, totals, counts, amounts, timestamps, codes))
+                return accounts
+
+    def journal_generations(self):
+        return sorted(
+            int(name[len("journal-"):-len(".log")])
+            for name in os.listdir(self.directory)
+            if name.startswith("journal-") and name.endswith(".log")
+        )
+
+    # Method to read the journal records written since the snapshot, oldest first. A torn record
+    # at the end of a journal (from a crash mid-write) is cut off.
+    def replay(self):
+        records = []
+        for generation in self.journal_generations():
+            if generation < self.generation:
+                continue
+            path = self.journal_path(generation)
+            with open(path, "rb") as journal_file:
+                data = journal_file.read()
+
+            if data.startswith(JOURNAL_MAGIC) and len(data) >= JOURNAL_HEADER.size:
+                if JOURNAL_HEADER.unpack_from(data, 0)[1] != JOURNAL_VERSION:
+                    raise StorageError(f"{path} is not a supported journal file")
+                offset = JOURNAL_HEADER.size
+            elif JOURNAL_MAGIC.startswith(data[:len(JOURNAL_MAGIC)]) and len(data) < JOURNAL_HEADER.size:
+                offset = 0  # Empty journal, or the torn header of a new one
+            else:
+                raise StorageError(f"{path} is not a supported journal file")
+
+            while offset + RECORD_HEADER.size <= len(data):
+                record_type, length, checksum = RECORD_HEADER.unpack_from(data, offset)
+                start = offset + RECORD_HEADER.size
+                payload = data[start:start + length]
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                records.append(self.decode_record(record_type, payload))
+                offset = start + length
+
+            if offset < len(data):
+                with open(path, "r+b") as journal_file:
+                    journal_file.truncate(offset)
+            self.generation = max(self.generation, generation)
+        return records
+
+    # Method to decode one journal record
+    def decode_record(self, record_type, payload):
+        account_number, offset = unpack_string(payload, 0)
+        if record_type == RECORD_ACCOUNT:
+            account_holder, offset = unpack_string(payload, offset)
+            (opening_balance,) = ACCOUNT_RECORD.unpack_from(payload, offset)
+            return AccountRecord(account_number, account_holder, opening_balance)
+        if record_type == RECORD_TRANSACTION:
+            index, amount, timestamp = TRANSACTION_RECORD.unpack_from(payload, offset)
+            category, offset = unpack_string(payload, offset + TRANSACTION_RECORD.size)
+            return TransactionRecord(account_number, index, amount, timestamp, category)
+        if record_type == RECORD_TRANSFER:
+            to_account, offset = unpack_string(payload, offset)
+            from_index, to_index, amount, timestamp = TRANSFER_RECORD.unpack_from(payload, offset)
+            return TransferRecord(account_number, from_index, to_account, to_index, amount, timestamp)
+        if record_type == RECORD_BATCH:
+            index, count, category_count, typecodes = BATCH_RECORD.unpack_from(payload, offset)
+            offset += BATCH_RECORD.size
+            categories = []
+            for _ in range(category_count):
+                category, offset = unpack_string(payload, offset)
+                categories.append(category)
+            typecodes = typecodes.decode("ascii")
+            amounts, offset = unpack_amounts(payload, offset, typecodes[0], count)
+            timestamps, offset = unpack_column(payload, offset, typecodes[1], count)
+            codes, offset = unpack_column(payload, offset, typecodes[2], count)
+            return BatchRecord(account_number, index, amounts, timestamps, codes, categories)
+        raise StorageError(f"unknown journal record type {record_type!r}")
+
+    # Method to start journaling changes of the given bank, after its state has been loaded
+    def attach(self, bank):
+        self.bank = bank
+        self.log = TransactionLog(self.journal_path(self.generation), self.commit_interval)
+
+    def append_record(self, record_type, payload):
+        log = self.log
+        sequence = log.append(RECORD_HEADER.pack(record_type, len(payload), zlib.crc32(payload)) + payload)
+        if sequence - self.checkpoint_sequence >= self.checkpoint_every:
+            with log.condition:
+                start = not self.checkpoint_pending
+                self.checkpoint_pending = True
+            if start:
+                # Writers may hold account locks here, so the snapshot is written on its own thread
+                threading.Thread(target=self.checkpoint, name="flazz-checkpoint", daemon=True).start()
+
+    def record_account(self, account):
+        payload = pack_string(account.account_number) + pack_string(account.account_holder) + ACCOUNT_RECORD.pack(account.opening_balance)
+        self.append_record(RECORD_ACCOUNT, payload)
+
+    def record_transaction(self, account_number, index, amount, timestamp, category):
+        payload = pack_string(account_number) + TRANSACTION_RECORD.pack(index, amount, timestamp) + pack_string(category)
+        self.append_record(RECORD_TRANSACTION, payload)
+
+    # Method to journal both legs of a transfer as one record, so it is replayed entirely or not at all
+    def record_transfer(self, from_account, from_index, to_account, to_index, amount, timestamp):
+        payload = pack_string(from_account) + pack_string(to_account) + TRANSFER_RECORD.pack(from_index, to_index, amount, timestamp)
+        self.append_record(RECORD_TRANSFER, payload)
+
+    # Method to journal many transactions of one account as a single record. The category codes
+    # index into the given list of categories.
+    def record_batch(self, account_number, index, amounts, timestamps, category_codes, categories):
+        typecodes = (amounts.typecode + timestamps.typecode + category_codes.typecode).encode("ascii")
+        parts = [pack_string(account_number), BATCH_RECORD.pack(index, len(amounts), len(categories), typecodes)]
+        parts.extend(pack_string(category) for category in categories)
+        parts.extend([amounts.tobytes(), timestamps.tobytes(), category_codes.tobytes()])
+        self.append_record(RECORD_BATCH, b"".join(parts))
+
+    # Method to wait until every record appended so far is on disk
+    def sync(self):
+        self.log.commit()
+
+    # Method to write a new snapshot and drop the journals it covers
+    def checkpoint(self):
+        with self.checkpoint_lock:
+            log = self.log
+            if log is None:
+                return  # Closed since the checkpoint was requested; close wrote the final snapshot
+            generation = self.generation + 1
+            sequence = log.rotate(self.journal_path(generation))
+            with log.condition:
+                self.checkpoint_sequence = sequence
+                self.checkpoint_pending = False
+
+            temporary_path = self.snapshot_path() + ".tmp"
+            with open(temporary_path, "wb") as snapshot_file:
+                self.write_snapshot(snapshot_file, generation)
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+            os.replace(temporary_path, self.snapshot_path())
+
+            for old_generation in self.journal_generations():
+                if old_generation < generation:
+                    os.remove(self.journal_path(old_generation))
+            self.generation = generation
+
+    def write_snapshot(self, snapshot_file, generation):
+        accounts = list(self.bank.accounts.values())
+        snapshot_file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation, len(accounts)))
+        snapshot_file.write(pack_string(self.bank.bank_name))
+
+        for account in accounts:
+            # Copy the account state under its lock, so balance, totals and columns match
+            with account.lock:
+                ledger = account.transactions
+                header = ACCOUNT_HEADER.pack(account.opening_balance, account.balance, len(ledger.categories), len(ledger))
+                typecodes = (ledger.amounts.typecode + ledger.timestamps.typecode + ledger.category_codes.typecode).encode("ascii")
+                categories = [pack_string(category) + CATEGORY_ENTRY.pack(total, count)
+                              for category, total, count in zip(ledger.categories, ledger.category_totals, ledger.category_counts)]
+                columns = [ledger.amounts.tobytes(), ledger.timestamps.tobytes(), ledger.category_codes.tobytes()]
+
+            snapshot_file.write(pack_string(account.account_number))
+            snapshot_file.write(pack_string(account.account_holder))
+            snapshot_file.write(header)
+            snapshot_file.write(typecodes)
+            snapshot_file.writelines(categories)
+            snapshot_file.writelines(columns)
+
+    # Method to write a final snapshot and close the journal
+    def close(self):
+        with self.checkpoint_lock:
+            if self.log is not None:
+                self.checkpoint()
+                self.log.close()
+                self.log = None
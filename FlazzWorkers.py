@@ -0,0 +1,84 @@
+# Process pools over the accounts of a bank, used by the bank-wide analytics and the batch
+# statement rendering.
+#
+# Work is sent to the workers as account entries (see describe_account). Where the platform can
+# fork, workers read the ledgers from the bank they inherit, so an entry is only the account's
+# number, holder, opening balance and transaction count; elsewhere each entry also carries copies
+# of the account's ledger columns.
+import multiprocessing
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import FlazzCore
+from FlazzCore import Account
+
+# The bank inherited by forked workers
+forked_bank = None
+
+
+def fork_available():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+# Helper function to describe an account for a worker: (number, holder, opening balance, entries)
+# plus copies of its columns when the workers cannot read the bank themselves
+def describe_account(account, with_columns):
+    with account.lock:
+        ledger = account.get_transaction_history()
+        count = len(ledger)
+        entry = (account.account_number, account.account_holder, account.opening_balance, count)
+        if with_columns:
+            entry += (ledger.amounts[:count].tobytes(), ledger.timestamps[:count].tobytes(),
+                      ledger.category_codes[:count].tobytes(), ledger.categories[:])
+        return entry
+
+# Helper function to read the ledger columns of an account entry in a worker, as (amounts,
+# timestamps, category codes, categories) with numpy arrays cut off at the entry's count
+def entry_columns(entry):
+    import numpy as np
+
+    if len(entry) > 4:
+        amounts, timestamps, codes, categories = entry[4:]
+    else:
+        ledger = forked_bank.accounts[entry[0]].get_transaction_history()
+        amounts, timestamps, codes, categories = ledger.amounts, ledger.timestamps, ledger.category_codes, ledger.categories[:]
+    count = entry[3]
+    return (np.frombuffer(amounts, dtype=np.int64, count=count),
+            np.frombuffer(timestamps, dtype=np.int64, count=count),
+            np.frombuffer(codes, dtype=np.uint16, count=count),
+            categories)
+
+# Helper function to get the account of an entry in a worker: the inherited account itself, or an
+# account rebuilt from the copied columns
+def entry_account(entry):
+    if len(entry) == 4:
+        return forked_bank.accounts[entry[0]]
+    number, holder, opening_balance, count, amounts, timestamps, codes, categories = entry
+    account = Account(number, holder, opening_balance)
+    account.record_batch(amounts, timestamps, array("H", codes), categories)
+    return account
+
+
+def init_worker(initializer):
+    # Locks are copied in whatever state they had when the worker was forked, so the inherited
+    # accounts get fresh ones
+    if forked_bank is not None:
+        FlazzCore.ACCOUNT_LOCKS[:] = [threading.RLock() for _ in range(FlazzCore.LOCK_STRIPES)]
+    if initializer is not None:
+        initializer()
+
+# Method to open a process pool for entries of the given bank, with forked workers when forked is
+# set and spawned ones otherwise. The entries must be described with columns for spawned workers.
+@contextmanager
+def account_pool(bank, workers, forked, initializer=None):
+    global forked_bank
+
+    context = multiprocessing.get_context("fork" if forked else "spawn")
+    forked_bank = bank if forked else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                                 initargs=(initializer,)) as pool:
+            yield pool
+    finally:
+        forked_bank = None
@@ -0,0 +1,22 @@
+from FlazzAnalysis import find_breaches, running_balance
+from FlazzCore import Account
+
+START = 1_700_000_000
+
+
+def test_running_balance_is_in_time_order():
+    account = Account("0000000001", "Test", 0)
+    account.record(50000, START, "Deposit")
+    account.record(-40000, START + 3600, "Supermarket")
+    account.record(20000, START + 7200, "Deposit")
+    # An imported deposit dated before everything else, recorded last
+    account.record(100000, START - 86400, "Deposit")
+
+    timestamps, balances = running_balance(account)
+    assert timestamps.tolist() == [START - 86400, START, START + 3600, START + 7200]
+    assert balances.tolist() == [100000, 150000, 110000, 130000]
+
+    breaches = find_breaches(timestamps, balances, {"danger": 120000})["danger"]
+    assert breaches.intervals() == [(0, 1), (2, 3)]
+    assert breaches.start_times.tolist() == [START - 86400, START + 3600]
+    assert breaches.durations.tolist() == [86400, 3600]
@@ -0,0 +1,92 @@
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from FlazzCore import Account, current_timestamp
+from FlazzCharts import DashboardCharts
+
+START = 1_700_000_000
+
+
+# Build dashboard charts for an account with a few transactions and complete the first full draw
+def drawn_charts():
+    account = Account("0000000001", "Test", 0)
+    for i, amount in enumerate([100000, -2500, 50000, -12000]):
+        account.record(amount, START + i * 3600, "Deposit" if amount > 0 else "Food")
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    charts = DashboardCharts(figure, figure.subplots(2, 2), account)
+    charts.draw(charts.update())
+    figure.canvas.draw()
+    return charts
+
+
+# Replace the canvas blit and draw_idle with recorders
+def record_draws(charts, monkeypatch):
+    calls = []
+    canvas = charts.figure.canvas
+    monkeypatch.setattr(canvas, "blit", lambda bbox=None: calls.append("blit"))
+    monkeypatch.setattr(canvas, "draw_idle", lambda: calls.append("draw_idle"))
+    return calls
+
+
+def test_append_inside_limits_is_blitted(monkeypatch):
+    charts = drawn_charts()
+    calls = record_draws(charts, monkeypatch)
+
+    change = charts.append_points(charts.stats_line, np.array([START + 5400]), np.array([100.0]))
+    assert change == (charts.stats_line.axes, False)
+    charts.draw([change])
+    assert calls == ["blit"]
+
+
+def test_append_outside_limits_redraws(monkeypatch):
+    charts = drawn_charts()
+    calls = record_draws(charts, monkeypatch)
+
+    change = charts.append_points(charts.stats_line, np.array([START + 30 * 86400]), np.array([5000.0]))
+    assert change == (charts.stats_line.axes, True)
+    charts.draw([change])
+    assert calls == ["draw_idle"]
+
+
+def test_draws_are_counted_while_metrics_are_on(monkeypatch):
+    import FlazzCharts
+    from FlazzMetrics import Metrics
+
+    charts = drawn_charts()
+    record_draws(charts, monkeypatch)
+    monkeypatch.setattr(FlazzCharts, "metrics", Metrics())
+
+    charts.draw([charts.append_points(charts.stats_line, np.array([START + 5400]), np.array([100.0]))])
+    charts.draw([charts.append_points(charts.stats_line, np.array([START + 30 * 86400]), np.array([5000.0]))])
+    assert FlazzCharts.metrics.snapshot()["counters"] == {"DashboardCharts.blitted_draws": 1, "DashboardCharts.full_redraws": 1}
+
+
+def test_live_taps_are_blitted(monkeypatch):
+    now = current_timestamp()
+    account = Account("0000000001", "Test", 0)
+    for i, amount in enumerate([100000, -2500, 50000, -12000, 30000, -800]):
+        account.record(amount, now - (6 - i) * 86400 - 3600, "Deposit" if amount > 0 else "Supermarket")
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    charts = DashboardCharts(figure, figure.subplots(2, 2), account)
+    charts.draw(charts.update())
+    figure.canvas.draw()
+
+    # The first taps after a quiet day may grow the limits; they then leave room for the next taps
+    account.record(50000, now, "Deposit")
+    account.record(-2000, now, "Supermarket")
+    charts.draw(charts.update())
+    figure.canvas.draw()
+    calls = record_draws(charts, monkeypatch)
+
+    # Taps arrive one by one with the newest timestamp and amounts like earlier ones
+    for tap, amount in enumerate([30000, -1500, -5000, 30000, -2500], start=1):
+        account.record(amount, now + tap, "Deposit" if amount > 0 else "Supermarket")
+        changes = charts.update()
+        assert [limits_changed for ax, limits_changed in changes] == [False] * len(changes)
+        charts.draw(changes)
+    assert calls == ["blit"] * 3 * 5  # The pattern, stats and deposit or spending axes of every tap
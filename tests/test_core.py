@@ -0,0 +1,242 @@
+import random
+import threading
+
+import pytest
+
+from FlazzCore import Bank, DAY, ROLLUP_RESOLUTIONS, format_amount, parse_amount, timestamp_seconds
+from FlazzStorage import SNAPSHOT_MAGIC, BankStorage, StorageError
+
+START = 1_700_000_000
+NUMBERS = [f"{i:010d}" for i in range(8)]
+
+
+# Helper function to get every account's balance and ledger amounts, to compare banks with
+def bank_state(bank):
+    return {number: (account.balance, list(account.transactions.amounts))
+            for number, account in sorted(bank.accounts.items())}
+
+# Helper function to stop journaling without the final snapshot that Bank.close writes, like a
+# process killed once its records were on disk
+def crash(bank):
+    bank.storage.log.close()
+    bank.storage = None
+
+def make_bank(data_dir=None, balance=10000):
+    bank = Bank("Test", data_dir=data_dir)
+    for number in NUMBERS:
+        bank.create_account(number, f"Holder {number}", balance)
+    return bank
+
+
+def test_journal_replay_after_crash(tmp_path):
+    bank = make_bank(tmp_path)
+    bank.get_account(NUMBERS[0]).deposit(500, "Deposit", START)
+    bank.get_account(NUMBERS[1]).withdraw(300, "Toll Road", START + 60)
+    assert bank.transfer_funds(NUMBERS[0], NUMBERS[2], 700)
+    expected = bank_state(bank)
+    crash(bank)
+
+    reopened = Bank("Test", data_dir=tmp_path)
+    try:
+        assert bank_state(reopened) == expected
+    finally:
+        reopened.close()
+
+
+def test_replay_after_crash_between_journal_rotation_and_snapshot(tmp_path):
+    bank = make_bank(tmp_path)
+    bank.get_account(NUMBERS[0]).deposit(500, "Deposit", START)
+    bank.storage.checkpoint()
+    bank.get_account(NUMBERS[1]).deposit(200, "Deposit", START + 60)
+
+    # A checkpoint that switched to the next journal but crashed before its snapshot was written
+    storage = bank.storage
+    generation = storage.generation
+    storage.log.rotate(storage.journal_path(generation + 1))
+    assert bank.transfer_funds(NUMBERS[1], NUMBERS[3], 900)
+    expected = bank_state(bank)
+    crash(bank)
+
+    # A torn record at the end of the newest journal is cut off
+    with open(storage.journal_path(generation + 1), "ab") as journal_file:
+        journal_file.write(b"X\x10\x00")
+
+    reopened = Bank("Test", data_dir=tmp_path)
+    try:
+        assert bank_state(reopened) == expected
+        assert reopened.storage.journal_generations() == [generation, generation + 1]
+        reopened.get_account(NUMBERS[4]).deposit(100, "Deposit", START + 120)
+        expected = bank_state(reopened)
+    finally:
+        reopened.close()
+
+    # Closing checkpoints into a single snapshot and journal
+    reopened = Bank("Test", data_dir=tmp_path)
+    try:
+        assert bank_state(reopened) == expected
+        assert len(reopened.storage.journal_generations()) == 1
+    finally:
+        reopened.close()
+
+
+def test_transfer_record_replays_only_missing_leg(tmp_path):
+    bank = make_bank(tmp_path)
+    assert bank.transfer_funds(NUMBERS[0], NUMBERS[1], 2500)
+    expected = bank_state(bank)
+    crash(bank)
+
+    # A snapshot taken while the transfer was being applied: it holds the source leg only
+    partial = make_bank()
+    source = partial.get_account(NUMBERS[0])
+    with source.lock:
+        source.apply(-2500, START, "Transfer")
+    storage = BankStorage(str(tmp_path))
+    storage.bank = partial
+    with open(storage.snapshot_path(), "wb") as snapshot_file:
+        storage.write_snapshot(snapshot_file, 0)
+
+    reopened = Bank("Test", data_dir=tmp_path)
+    try:
+        assert bank_state(reopened) == expected
+        assert len(reopened.get_account(NUMBERS[0]).transactions) == 1
+        assert len(reopened.get_account(NUMBERS[1]).transactions) == 1
+    finally:
+        reopened.close()
+
+
+def test_concurrent_transfers_are_atomic(tmp_path):
+    bank = make_bank(tmp_path, balance=1000)
+
+    def transfer(seed):
+        rng = random.Random(seed)
+        for _ in range(200):
+            if rng.random() < 0.5:
+                bank.transfer_funds(rng.choice(NUMBERS), rng.choice(NUMBERS), rng.randint(1, 400))
+            else:
+                bank.transfer_many([(rng.choice(NUMBERS), rng.choice(NUMBERS), rng.randint(1, 400)) for _ in range(5)])
+
+    threads = [threading.Thread(target=transfer, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    accounts = list(bank.accounts.values())
+    assert sum(account.balance for account in accounts) == 1000 * len(NUMBERS)
+    for account in accounts:
+        assert account.balance >= 0
+        assert account.balance == account.opening_balance + sum(account.transactions.amounts)
+
+    expected = bank_state(bank)
+    bank.close()
+    reopened = Bank("Test", data_dir=tmp_path)
+    try:
+        assert bank_state(reopened) == expected
+    finally:
+        reopened.close()
+
+
+def test_concurrent_spending_never_overdraws():
+    bank = make_bank(balance=1000)
+    source = bank.get_account(NUMBERS[0])
+    results = []
+
+    def spend():
+        for _ in range(100):
+            results.append(bank.transfer_funds(NUMBERS[0], NUMBERS[1], 30))
+            results.append(source.withdraw(30, "Other"))
+
+    threads = [threading.Thread(target=spend) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 1000 // 30
+    assert source.balance == 1000 % 30
+
+
+@pytest.mark.parametrize("resolution", ROLLUP_RESOLUTIONS)
+def test_time_queries_match_rollups(resolution):
+    bank = make_bank(balance=0)
+    account = bank.get_account(NUMBERS[0])
+    rng = random.Random(5)
+    for _ in range(2000):
+        timestamp = START + rng.randrange(120 * DAY)  # Recorded out of time order
+        if rng.random() < 0.4 or account.balance < 10000:
+            account.deposit(rng.randint(1, 50000), "Deposit", timestamp)
+        else:
+            account.withdraw(rng.randint(1, 10000), "Supermarket", timestamp)
+
+    starts, credits, debits, counts = account.get_rollup(resolution)
+    ends = starts[1:] + [None]
+    balance = account.opening_balance
+    for start, end, credit, debit, count in zip(starts, ends, credits, debits, counts):
+        window = account.history_between(start, end)
+        amounts = [transaction.amount for transaction in window]
+        assert len(window) == count
+        assert sum(amount for amount in amounts if amount > 0) == credit
+        assert sum(amount for amount in amounts if amount < 0) == debit
+
+        balance += credit + debit
+        last = timestamp_seconds(window[-1].timestamp)
+        assert account.balance_at(last) == balance
+    assert balance == account.balance
+
+
+def test_float_format_files_are_refused(tmp_path):
+    bank = make_bank(tmp_path)
+    bank.close()
+    storage = BankStorage(str(tmp_path))
+
+    # Version 1 snapshots and header-less journals held float rupiah
+    with open(storage.snapshot_path(), "r+b") as snapshot_file:
+        snapshot_file.seek(len(SNAPSHOT_MAGIC))
+        snapshot_file.write(b"\x01\x00")
+    with pytest.raises(StorageError):
+        storage.read_snapshot()
+
+    with open(storage.journal_path(storage.generation + 1), "wb") as journal_file:
+        journal_file.write(b"T\x10\x00\x00\x00\x00\x00\x00\x00")
+    with pytest.raises(StorageError):
+        storage.replay()
+
+
+def test_amounts_round_trip_exactly():
+    for text, amount in (("12,500.50", 1250050), ("0.01", 1), ("-7", -700), (12.5, 1250)):
+        assert parse_amount(text) == amount
+        assert parse_amount(format_amount(amount)) == amount
+    for value in (True, False, "1.005", float("nan"), 2 ** 63 // 100 + 1):
+        with pytest.raises(ValueError):
+            parse_amount(value)
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+def test_automatic_checkpoints_under_concurrent_writes(tmp_path):
+    bank = Bank("Test")
+    bank.open_storage(str(tmp_path), checkpoint_every=25)
+    for number in NUMBERS:
+        bank.create_account(number, f"Holder {number}", 0)
+
+    def deposit(number):
+        account = bank.get_account(number)
+        for second in range(300):
+            account.deposit(100, "Deposit", START + second)
+
+    threads = [threading.Thread(target=deposit, args=(number,)) for number in NUMBERS]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    expected = bank_state(bank)
+    storage = bank.storage
+    bank.close()
+    # A checkpoint thread started by the last writes may only run once the journal is closed
+    storage.checkpoint()
+
+    reopened = Bank("Test", data_dir=tmp_path)
+    try:
+        assert bank_state(reopened) == expected
+        assert len(reopened.storage.journal_generations()) == 1
+    finally:
+        reopened.close()
@@ -0,0 +1,36 @@
+from array import array
+
+import pytest
+
+from FlazzCore import AMOUNT_LIMIT, Account
+from FlazzImport import import_transactions
+
+
+def write_csv(path, rows):
+    path.write_text("Category,Amount,Timestamp\n" + "".join(f"{category},{amount},2024-01-01 00:00:00\n" for category, amount in rows))
+    return path
+
+
+def test_import_refuses_a_chunk_that_overflows_the_balance(tmp_path):
+    account = Account("0000000001", "Test", 0)
+    path = write_csv(tmp_path / "big.csv", [("Deposit", "9999999999999.99")] * 10000)
+    with pytest.raises(ValueError, match="Balance out of range after the transaction 9224 rows"):
+        import_transactions(account, path)
+    assert account.balance == 0
+
+
+def test_import_reports_the_overdrawing_row(tmp_path):
+    account = Account("0000000001", "Test", 0)
+    path = write_csv(tmp_path / "spend.csv", [("Deposit", "10.50"), ("Supermarket", "-4.25"), ("Other", "-7")])
+    with pytest.raises(ValueError, match="Insufficient funds for the withdrawal 3 rows"):
+        import_transactions(account, path)
+    assert import_transactions(account, write_csv(tmp_path / "ok.csv", [("Deposit", "10.50"), ("Supermarket", "-4.25")])) == (2, 0)
+    assert account.balance == 625
+
+
+def test_record_batch_refuses_an_out_of_range_balance():
+    account = Account("0000000001", "Test", 0)
+    with pytest.raises(ValueError):
+        account.record_batch(array("q", [AMOUNT_LIMIT - 1, 1]), array("q", [1, 2]), array("H", [0, 0]), ["Deposit"])
+    assert account.balance == 0
+    assert len(account.get_transaction_history()) == 0
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+from FlazzCore import AMOUNT_LIMIT, Bank
+from FlazzServer import TapClient, TapServer
+
+
+def make_bank(data_dir=None):
+    bank = Bank("Test", data_dir=data_dir)
+    bank.create_account("0000000001", "Holder", 0)
+    bank.create_account("0000000002", "Holder", 0)
+    bank.create_account("0000000003", "Holder", AMOUNT_LIMIT - 100)
+    return bank
+
+# Helper function to run a coroutine against a tap server of the bank, started on a free localhost port
+def serve(bank, session):
+    async def run():
+        server = TapServer(bank, max_batch=16)
+        port = await server.start(port=0)
+        try:
+            return await session(port)
+        finally:
+            await server.stop()
+    return asyncio.run(run())
+
+
+def test_pipelined_requests_are_acknowledged_in_order(tmp_path):
+    bank = make_bank(tmp_path)
+
+    async def session(port):
+        client = await TapClient.connect(port=port)
+        futures = [client.send("deposit", "0000000001", "1000.50")]
+        for _ in range(40):
+            futures.append(client.send("withdraw", "0000000001", 10, category="Toll Road"))
+            futures.append(client.send("transfer", "0000000001", 5, to="0000000002"))
+        futures.append(client.send("balance", "0000000002"))
+        await client.writer.drain()
+        responses = await asyncio.gather(*futures)
+        await client.close()
+        return responses
+
+    responses = serve(bank, session)
+    assert [response["id"] for response in responses] == list(range(1, 83))
+    assert all(response["ok"] for response in responses)
+    assert responses[0]["balance"] == "1000.50"
+    assert responses[-2]["balance"] == "400.50"
+    assert responses[-1]["balance"] == "200.00"
+    bank.close()
+
+    reopened = Bank("Test", data_dir=tmp_path)
+    try:
+        assert reopened.get_account("0000000001").balance == 40050
+    finally:
+        reopened.close()
+
+
+def test_invalid_requests_are_rejected():
+    bank = make_bank()
+    requests = [
+        b"not json",
+        {"id": 2, "op": "refund", "account": "0000000001", "amount": 10},
+        {"id": 3, "op": "deposit", "account": "0000000001"},
+        {"id": 4, "op": "deposit", "account": "0000000001", "amount": True},
+        {"id": 5, "op": "deposit", "account": "0000000001", "amount": -10},
+        {"id": 6, "op": "deposit", "account": "0000000001", "amount": "1.005"},
+        {"id": 7, "op": "withdraw", "account": "0000000001", "amount": 10, "category": "Bogus"},
+        {"id": 8, "op": "deposit", "account": "0000000009", "amount": 10},
+        {"id": 9, "op": "withdraw", "account": "0000000001", "amount": 10, "category": "Other"},
+        {"id": 10, "op": "deposit", "account": "0000000001", "amount": 10},
+    ]
+
+    async def session(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for request in requests:
+            writer.write((request if isinstance(request, bytes) else json.dumps(request).encode()) + b"\n")
+        await writer.drain()
+        responses = [json.loads(await reader.readline()) for _ in requests]
+        writer.close()
+        await writer.wait_closed()
+        return responses
+
+    responses = serve(bank, session)
+    assert [response["id"] for response in responses] == [None] + list(range(2, 11))
+    assert [response["ok"] for response in responses] == [False] * 9 + [True]
+    assert responses[7]["error"] == "unknown account"
+    assert responses[8]["error"] == "insufficient funds"
+    assert bank.get_account("0000000001").balance == 1000
+
+
+def test_failing_event_does_not_stall_the_batcher():
+    bank = make_bank()
+
+    async def session(port):
+        client = await TapClient.connect(port=port)
+        futures = [
+            client.send("deposit", "0000000001", 10),
+            client.send("deposit", "0000000003", 10),  # Raises: the balance would not fit int64
+            client.send("deposit", "0000000001", 20),
+        ]
+        await client.writer.drain()
+        responses = await asyncio.gather(*futures)
+        responses.append(await client.request("balance", "0000000001"))
+        await client.close()
+        return responses
+
+    responses = serve(bank, session)
+    assert [response["ok"] for response in responses] == [True, False, True, True]
+    assert "out of range" in responses[1]["error"]
+    assert responses[3]["balance"] == "30.00"
+    assert bank.get_account("0000000003").balance == AMOUNT_LIMIT - 100
@@ -0,0 +1,89 @@
+import itertools
+
+import pytest
+
+from FlazzCore import AMOUNT_LIMIT, Bank
+from FlazzShards import Shard, ShardError, ShardedBank
+
+
+def make_shard(balances):
+    bank = Bank("Test")
+    for number, balance in balances.items():
+        bank.create_account(number, f"Holder {number}", balance)
+    return Shard(bank)
+
+# Helper function to find account numbers that the sharded bank places on the given shards
+def numbers_on(bank, shards):
+    numbers = (f"{i:010d}" for i in itertools.count())
+    found = []
+    for shard in shards:
+        found.append(next(number for number in numbers if bank.shard_of(number) == shard))
+    return found
+
+
+@pytest.fixture
+def sharded_bank():
+    bank = ShardedBank(2, "Test")
+    yield bank
+    bank.close()
+
+
+def test_hold_blocks_double_spend():
+    shard = make_shard({"A": 1000, "B": 0})
+    assert shard.prepare_debit(1, "A", 800)
+
+    # Only 200 is available until the transfer is decided
+    assert not shard.withdraw("A", 300, "Other")
+    assert not shard.transfer("A", "B", 300)
+    assert not shard.prepare_debit(2, "A", 300)
+    assert shard.withdraw("A", 200, "Other")
+
+    assert shard.commit(1, 1_700_000_000)
+    assert shard.balance("A") == 0
+    assert shard.held == {}
+
+
+def test_abort_releases_holds_and_incoming_credits():
+    shard = make_shard({"A": 1000, "B": AMOUNT_LIMIT - 1000})
+    assert shard.prepare_debit(1, "A", 800)
+    assert shard.prepare_credit(2, "B", 600)
+    assert not shard.prepare_credit(3, "B", 600)  # Both credits together would not fit int64
+
+    assert shard.abort(1) and shard.abort(2)
+    assert shard.held == {} and shard.incoming == {}
+    assert shard.debits == {} and shard.credits == {}
+    assert shard.prepare_credit(3, "B", 600)
+    assert shard.withdraw("A", 1000, "Other")
+    assert shard.balance("B") == AMOUNT_LIMIT - 1000
+
+
+def test_transfer_many_mixes_same_shard_and_cross_shard_transfers(sharded_bank):
+    a, b, c, d = numbers_on(sharded_bank, [0, 0, 1, 1])
+    for number, balance in ((a, 1000), (b, 0), (c, 0), (d, 0)):
+        assert sharded_bank.create_account(number, "Holder", balance)
+
+    results = sharded_bank.transfer_many([
+        (a, b, 300),  # Same shard, applied in phase one
+        (a, c, 500),  # Across shards, holding 500 of a
+        (a, c, 500),  # Refused: only 200 of a is not on hold
+        (c, d, 100),  # Refused: the credit to c is only committed after the batch
+        (b, c, 200),  # Across shards, spending what b received earlier in the batch
+    ])
+    assert results == [True, True, False, False, True]
+    assert [sharded_bank.get_balance(number) for number in (a, b, c, d)] == [200, 100, 700, 0]
+
+
+def test_failing_operation_does_not_stop_its_shard(sharded_bank):
+    a, c = numbers_on(sharded_bank, [0, 1])
+    assert sharded_bank.create_account(a, "Holder", 1000)
+    assert sharded_bank.create_account(c, "Holder", 1000)
+
+    results = sharded_bank.execute([("deposit", a, 12.5), ("deposit", a, 250), ("deposit", c, 100)])
+    assert isinstance(results[0], ShardError)
+    assert results[1:] == [True, True]
+    with pytest.raises(ShardError):
+        sharded_bank.withdraw(a, "100", "Other")
+
+    assert sharded_bank.get_balance(a) == 1250
+    assert sharded_bank.transfer_funds(a, c, 250)
+    assert [sharded_bank.get_balance(number) for number in (a, c)] == [1000, 1350]